@@ -0,0 +1,218 @@
+"""
+Aggregation Cube
+Materializes AQI rollups by country, category, pollutant, collection date and
+population band so any aggregate view can be sliced without touching raw rows
+"""
+
+import pandas as pd
+import numpy as np
+import json
+import os
+from full_collection import log_step
+
+CUBE_PATH = 'data/aqi_rollup_cube.csv'
+SOURCES_PATH = 'data/aqi_rollup_cube_sources.json'
+HIGH_WATER_PATH = 'data/aqi_rollup_cube_high_water.csv'
+
+# A reading is one city's measurement at one collection time; each is counted in the cube once.
+# Only the latest ingested timestamp per city is kept, so the check never grows with history
+READING_KEY = ['city', 'country', 'collection_timestamp']
+
+DIMENSIONS = ['iso3', 'aqi_category', 'dominant_pollutant', 'collection_date', 'population_band']
+
+# AQI is 0-100, so one histogram bin per point is an exact, mergeable quantile sketch
+HIST_BINS = 101
+HIST_COLUMNS = [f'hist_{i:03d}' for i in range(HIST_BINS)]
+SCALAR_MEASURES = ['cities', 'population', 'aqi_count', 'aqi_sum', 'aqi_sum_sq']
+ADDITIVE_MEASURES = SCALAR_MEASURES + HIST_COLUMNS
+
+POPULATION_BANDS = [0, 1e6, 5e6, 10e6, np.inf]
+POPULATION_LABELS = ['small (<1M)', 'medium (1-5M)', 'large (5-10M)', 'mega (>10M)']
+
+def add_dimension_columns(df):
+    """Derive the cube dimensions from integrated dataset columns"""
+    dims = pd.DataFrame(index=df.index)
+    dims['iso3'] = df['iso3']
+    dims['aqi_category'] = df['aqi_category']
+    dims['dominant_pollutant'] = df['dominant_pollutant']
+    timestamps = pd.to_datetime(df['collection_timestamp'], errors='coerce')
+    dims['collection_date'] = timestamps.dt.strftime('%Y-%m-%d')
+    dims['population_band'] = pd.cut(df['population'], POPULATION_BANDS, labels=POPULATION_LABELS,
+                                     right=False).astype(object)
+    # Missing values become their own member so they still roll up
+    return dims.fillna('missing').astype(str)
+
+def build_cube_cells(df):
+    """Aggregate integrated rows to the finest cube grain (one cell per dimension combination)"""
+    dims = add_dimension_columns(df)
+    aqi = pd.to_numeric(df['aqi'], errors='coerce').to_numpy(dtype=float)
+    has_aqi = ~np.isnan(aqi)
+
+    grouped = dims.groupby(DIMENSIONS, sort=False)
+    cell_id = grouped.ngroup().to_numpy()
+    cells = grouped.size().reset_index(name='cities')
+    num_cells = len(cells)
+    cells['population'] = np.bincount(cell_id, weights=np.nan_to_num(df['population'].to_numpy(dtype=float)),
+                                      minlength=num_cells)
+    cells['aqi_count'] = np.bincount(cell_id, weights=has_aqi, minlength=num_cells).astype(int)
+    cells['aqi_sum'] = np.bincount(cell_id, weights=np.where(has_aqi, aqi, 0), minlength=num_cells)
+    cells['aqi_sum_sq'] = np.bincount(cell_id, weights=np.where(has_aqi, aqi ** 2, 0), minlength=num_cells)
+
+    aqi_min = np.full(num_cells, np.inf)
+    aqi_max = np.full(num_cells, -np.inf)
+    np.minimum.at(aqi_min, cell_id[has_aqi], aqi[has_aqi])
+    np.maximum.at(aqi_max, cell_id[has_aqi], aqi[has_aqi])
+    cells['aqi_min'] = np.where(np.isfinite(aqi_min), aqi_min, np.nan)
+    cells['aqi_max'] = np.where(np.isfinite(aqi_max), aqi_max, np.nan)
+
+    bins = np.clip(np.round(aqi[has_aqi]), 0, HIST_BINS - 1).astype(int)
+    hist = np.bincount(cell_id[has_aqi] * HIST_BINS + bins, minlength=num_cells * HIST_BINS)
+    hist = pd.DataFrame(hist.reshape(num_cells, HIST_BINS), columns=HIST_COLUMNS)
+    return pd.concat([cells, hist], axis=1)
+
+def rollup_cells(cells, by):
+    """Aggregate cube cells up to the dimensions in `by`"""
+    grouped = cells.groupby(list(by), sort=False)
+    rolled = pd.concat([
+        grouped[SCALAR_MEASURES].sum(),
+        grouped['aqi_min'].min(),
+        grouped['aqi_max'].max(),
+        grouped[HIST_COLUMNS].sum()
+    ], axis=1)
+    return pd.concat([rolled.index.to_frame(index=False), rolled.reset_index(drop=True)], axis=1)
+
+def merge_cells(cells, other_cells):
+    """Combine two sets of cube cells at the finest grain"""
+    return rollup_cells(pd.concat([cells, other_cells], ignore_index=True), DIMENSIONS)
+
+def load_cube(cube_path=CUBE_PATH, sources_path=SOURCES_PATH):
+    """Load the materialized cube and the list of sources that contributed to it"""
+    if not os.path.exists(cube_path):
+        return None, []
+    cube = pd.read_csv(cube_path, dtype={d: str for d in DIMENSIONS}, keep_default_na=False,
+                       na_values={'aqi_min': [''], 'aqi_max': ['']})
+    sources = []
+    if os.path.exists(sources_path):
+        with open(sources_path) as f:
+            sources = json.load(f)
+    return cube, sources
+
+def save_cube(cube, sources, cube_path=CUBE_PATH, sources_path=SOURCES_PATH):
+    """Save the cube cells and the snapshot list"""
+    cube.to_csv(cube_path, index=False)
+    with open(sources_path, 'w') as f:
+        json.dump(sources, f, indent=2)
+
+def reading_keys(df):
+    """(city, country, collection_timestamp) per row, with timestamps in one sortable ISO format ('' when missing)"""
+    keys = df[['city', 'country']].astype(str)
+    timestamps = pd.to_datetime(df['collection_timestamp'], format='ISO8601', errors='coerce')
+    keys['collection_timestamp'] = timestamps.dt.strftime('%Y-%m-%dT%H:%M:%S.%f').fillna('')
+    return keys
+
+def load_high_water(high_water_path=HIGH_WATER_PATH):
+    """Latest collection timestamp already folded into the cube, per (city, country)"""
+    if not os.path.exists(high_water_path):
+        return pd.Series(dtype=str, index=pd.MultiIndex.from_tuples([], names=['city', 'country']))
+    high_water = pd.read_csv(high_water_path, dtype=str, keep_default_na=False)
+    return high_water.set_index(['city', 'country'])['collection_timestamp']
+
+def update_cube(final_data, source_id=None, cube_path=CUBE_PATH, sources_path=SOURCES_PATH,
+                high_water_path=HIGH_WATER_PATH):
+    """Fold integrated rows into the cube; readings already ingested, from any source, are skipped
+
+    A reading is new if it is later than the city's high-water timestamp. A row without a
+    timestamp only counts for a city the cube has never seen. Readings older than a city's
+    latest ingested one (a late backfill) are treated as already ingested.
+    """
+    if source_id is None:
+        # The latest collection timestamp identifies the run the snapshot came from
+        source_id = str(final_data['collection_timestamp'].dropna().max())
+
+    cube, sources = load_cube(cube_path, sources_path)
+    keys = reading_keys(final_data)
+    high_water = load_high_water(high_water_path)
+    previous = high_water.reindex(pd.MultiIndex.from_frame(keys[['city', 'country']]))
+    seen = previous.notna().to_numpy()
+    later = (keys['collection_timestamp'].to_numpy() > previous.fillna('').to_numpy()).astype(bool)
+    is_new = np.where(seen, later, True) & ~keys.duplicated().to_numpy()
+    if not is_new.any():
+        print(f"All {len(final_data)} readings from {source_id} already in cube")
+        return cube
+
+    new_rows = final_data[is_new]
+    new_cells = build_cube_cells(new_rows)
+    cube = new_cells if cube is None else merge_cells(cube, new_cells)
+    sources.append(source_id)
+    save_cube(cube, sources, cube_path, sources_path)
+    latest = keys[is_new].groupby(['city', 'country'])['collection_timestamp'].max()
+    high_water = pd.concat([high_water, latest]).groupby(level=['city', 'country']).max()
+    high_water.reset_index(name='collection_timestamp').to_csv(high_water_path, index=False)
+
+    log_step('Aggregation Cube', f'Added {len(new_rows)} new readings from {source_id} '
+             f'({len(final_data) - len(new_rows)} already in cube), cube now has {len(cube)} cells')
+    return cube
+
+def histogram_quantiles(hist, totals, q):
+    """Quantile q per row from 1-point AQI histograms"""
+    cumulative = np.cumsum(hist, axis=1)
+    target = np.ceil(q * totals)[:, None]
+    position = (cumulative >= np.maximum(target, 1)).argmax(axis=1).astype(float)
+    position[totals == 0] = np.nan
+    return position
+
+def slice_cube(cube, by=(), filters=None, quantiles=(0.5, 0.9)):
+    """Roll the cube up to the dimensions in `by` after applying equality filters
+
+    filters maps a dimension to a value or list of values, e.g.
+    slice_cube(cube, by=['iso3'], filters={'aqi_category': 'Good air quality'})
+    """
+    cells = cube
+    for dim, value in (filters or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        cells = cells[cells[dim].isin([str(v) for v in values])]
+
+    by = list(by)
+    if not by:
+        by = ['all']
+        cells = pd.concat([cells, pd.Series('all', index=cells.index, name='all')], axis=1)
+    view = rollup_cells(cells, by)
+
+    n = view['aqi_count'].to_numpy(dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = view['aqi_sum'] / n
+        variance = (view['aqi_sum_sq'] - view['aqi_sum'] ** 2 / n) / (n - 1)
+
+    result = view[by].copy()
+    result['cities'] = view['cities']
+    result['population'] = view['population']
+    result['aqi_count'] = view['aqi_count']
+    result['aqi_mean'] = mean.round(2)
+    result['aqi_std'] = np.sqrt(variance.clip(lower=0)).round(2)
+    result['aqi_min'] = view['aqi_min']
+    result['aqi_max'] = view['aqi_max']
+
+    hist = view[HIST_COLUMNS].to_numpy()
+    for q in quantiles:
+        result[f'aqi_p{int(q * 100)}'] = histogram_quantiles(hist, n, q)
+    return result.sort_values('aqi_count', ascending=False).reset_index(drop=True)
+
+def main():
+    """Main execution function"""
+    print("=== Aggregation Cube ===\n")
+
+    final_data = pd.read_csv('data/integrated_cities_air_quality_final.csv')
+    cube = update_cube(final_data)
+
+    print("\nBy population band:")
+    print(slice_cube(cube, by=['population_band']).to_string(index=False))
+    print("\nBy dominant pollutant:")
+    print(slice_cube(cube, by=['dominant_pollutant']).to_string(index=False))
+    print("\nTop countries (3+ cities with AQI):")
+    by_country = slice_cube(cube, by=['iso3'])
+    print(by_country[by_country['aqi_count'] >= 3].sort_values('aqi_mean', ascending=False).head(15).to_string(index=False))
+
+    print("\n=== Aggregation Cube Complete ===")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Temporal Anomaly Detection Script
+Keeps a rolling AQI baseline per city across raw snapshots and flags readings
+that are unusual for that city, one vectorized pass per new snapshot
+"""
+
+import pandas as pd
+import numpy as np
+import glob
+import json
+import os
+from full_collection import log_step
+
+STATE_PATH = 'data/aqi_anomaly_state.npz'
+SOURCES_PATH = 'data/aqi_anomaly_sources.json'
+ANOMALIES_PATH = 'data/aqi_anomalies.csv'
+
+# Rolling window of recent readings per city for the median/MAD baseline
+WINDOW = 24
+# Readings a city needs before it can be flagged
+MIN_HISTORY = 6
+# Modified z-score (0.6745 * deviation / MAD) above which a reading is an anomaly
+ROBUST_THRESHOLD = 3.5
+# AQI is reported in whole points, so a stable city can have MAD 0; never divide by less
+MIN_MAD = 2.0
+# EWMA smoothing for the secondary mean/variance baseline
+EWMA_ALPHA = 0.1
+MIN_EWMA_STD = 2.0
+
+ANOMALY_COLUMNS = ['city', 'country', 'collection_timestamp', 'snapshot', 'aqi', 'baseline_median',
+                   'baseline_mad', 'robust_score', 'ewma_mean', 'ewma_z', 'history_count', 'direction']
+
+def empty_state():
+    """Baseline arrays for zero cities"""
+    return {
+        'cities': np.array([], dtype=object),
+        'countries': np.array([], dtype=object),
+        'window': np.empty((0, WINDOW)),
+        'count': np.zeros(0, dtype=int),
+        'ewma_mean': np.zeros(0),
+        'ewma_var': np.zeros(0),
+        'last_timestamp': np.zeros(0)
+    }
+
+def load_state(state_path=STATE_PATH, sources_path=SOURCES_PATH):
+    """Load the per-city baseline arrays and the snapshots already folded in"""
+    if not os.path.exists(state_path):
+        return empty_state(), []
+    with np.load(state_path) as saved:
+        state = {name: saved[name] for name in saved.files}
+    state['cities'] = state['cities'].astype(object)
+    state['countries'] = state['countries'].astype(object)
+
+    sources = []
+    if os.path.exists(sources_path):
+        with open(sources_path) as f:
+            sources = json.load(f)
+    return state, sources
+
+def save_state(state, sources, state_path=STATE_PATH, sources_path=SOURCES_PATH):
+    """Save the baseline arrays and snapshot list"""
+    arrays = dict(state)
+    arrays['cities'] = state['cities'].astype(str)
+    arrays['countries'] = state['countries'].astype(str)
+    np.savez(state_path, **arrays)
+    with open(sources_path, 'w') as f:
+        json.dump(sources, f, indent=2)
+
+def city_indices(state, cities, countries):
+    """Row index of each (city, country) in the state arrays, adding rows for new cities"""
+    known = pd.MultiIndex.from_arrays([state['cities'], state['countries']])
+    idx = known.get_indexer(pd.MultiIndex.from_arrays([cities, countries]))
+
+    new = idx == -1
+    if new.any():
+        n_known = len(state['cities'])
+        n_new = int(new.sum())
+        idx[new] = np.arange(n_known, n_known + n_new)
+        state['cities'] = np.concatenate([state['cities'], cities[new]])
+        state['countries'] = np.concatenate([state['countries'], countries[new]])
+        state['window'] = np.vstack([state['window'], np.full((n_new, WINDOW), np.nan)])
+        state['count'] = np.concatenate([state['count'], np.zeros(n_new, dtype=int)])
+        state['ewma_mean'] = np.concatenate([state['ewma_mean'], np.zeros(n_new)])
+        state['ewma_var'] = np.concatenate([state['ewma_var'], np.zeros(n_new)])
+        state['last_timestamp'] = np.concatenate([state['last_timestamp'], np.full(n_new, -np.inf)])
+    return idx
+
+def load_snapshot_readings(filepath):
+    """Successful readings from one raw snapshot, one per city"""
+    raw = pd.read_csv(filepath)
+    raw = raw[(raw['status'] == 'success') & raw['aqi'].notna()].copy()
+    raw['collection_timestamp'] = pd.to_datetime(raw['collection_timestamp'], errors='coerce')
+    raw = raw.dropna(subset=['collection_timestamp'])
+    return raw.sort_values('collection_timestamp').drop_duplicates(subset=['city', 'country'], keep='last')
+
+def score_snapshot(state, readings, snapshot):
+    """Score one snapshot against each city's baseline, then fold it into the baseline"""
+    cities = readings['city'].to_numpy(dtype=object)
+    countries = readings['country'].to_numpy(dtype=object)
+    aqi = readings['aqi'].to_numpy(dtype=float)
+    seconds = (readings['collection_timestamp'].astype('datetime64[ns]').astype('int64') / 1e9).to_numpy()
+
+    idx = city_indices(state, cities, countries)
+
+    # The polling scheduler repeats a city's last reading until it is re-polled; skip readings already seen
+    fresh = seconds > state['last_timestamp'][idx]
+    idx, aqi, seconds = idx[fresh], aqi[fresh], seconds[fresh]
+    readings = readings[fresh]
+
+    count = state['count'][idx]
+    window = state['window'][idx]
+    scored = count >= MIN_HISTORY
+
+    # Robust baseline from the rolling window (scored cities have at least MIN_HISTORY readings)
+    median = np.full(len(idx), np.nan)
+    mad = np.full(len(idx), np.nan)
+    if scored.any():
+        median[scored] = np.nanmedian(window[scored], axis=1)
+        mad[scored] = np.nanmedian(np.abs(window[scored] - median[scored, None]), axis=1)
+    robust_score = 0.6745 * (aqi - median) / np.maximum(mad, MIN_MAD)
+
+    ewma_mean = state['ewma_mean'][idx]
+    ewma_std = np.maximum(np.sqrt(state['ewma_var'][idx]), MIN_EWMA_STD)
+    ewma_z = np.where(count > 0, (aqi - ewma_mean) / ewma_std, np.nan)
+
+    flagged = scored & (np.abs(robust_score) >= ROBUST_THRESHOLD)
+    anomalies = pd.DataFrame({
+        'city': readings['city'].to_numpy()[flagged],
+        'country': readings['country'].to_numpy()[flagged],
+        'collection_timestamp': readings['collection_timestamp'].to_numpy()[flagged],
+        'snapshot': snapshot,
+        'aqi': aqi[flagged],
+        'baseline_median': median[flagged],
+        'baseline_mad': mad[flagged],
+        'robust_score': robust_score[flagged].round(2),
+        'ewma_mean': ewma_mean[flagged].round(2),
+        'ewma_z': ewma_z[flagged].round(2),
+        'history_count': count[flagged],
+        # Higher UAQI means cleaner air, so a drop below baseline is a pollution spike
+        'direction': np.where(robust_score[flagged] < 0, 'pollution_spike', 'unusually_clean')
+    }, columns=ANOMALY_COLUMNS)
+
+    # Fold the new readings in: ring-buffer write plus EWMA update
+    state['window'][idx, count % WINDOW] = aqi
+    delta = aqi - ewma_mean
+    first = count == 0
+    state['ewma_mean'][idx] = np.where(first, aqi, ewma_mean + EWMA_ALPHA * delta)
+    state['ewma_var'][idx] = np.where(first, 0.0, (1 - EWMA_ALPHA) * (state['ewma_var'][idx] + EWMA_ALPHA * delta ** 2))
+    state['count'][idx] = count + 1
+    state['last_timestamp'][idx] = seconds
+
+    return anomalies, len(idx), int(scored.sum())
+
+def update_anomalies(filepath, state_path=STATE_PATH, sources_path=SOURCES_PATH, anomalies_path=ANOMALIES_PATH):
+    """Score one new raw snapshot and append its anomalies; snapshots already processed are skipped"""
+    snapshot = os.path.basename(filepath)
+    state, sources = load_state(state_path, sources_path)
+    if snapshot in sources:
+        print(f"Snapshot {snapshot} already scored")
+        return None
+
+    readings = load_snapshot_readings(filepath)
+    anomalies, fresh, scored = score_snapshot(state, readings, snapshot)
+    sources.append(snapshot)
+    save_state(state, sources, state_path, sources_path)
+
+    if len(anomalies) > 0:
+        anomalies.to_csv(anomalies_path, mode='a', header=not os.path.exists(anomalies_path), index=False)
+    log_step('Anomaly Detection', f'{snapshot}: {fresh} new readings, {scored} with a baseline, '
+             f'{len(anomalies)} anomalies')
+    return anomalies
+
+def main(pattern='data/raw_air_quality_*.csv'):
+    """Main execution function"""
+    print("=== Temporal Anomaly Detection Script ===\n")
+
+    # The timestamp in the file name orders the snapshots; a first run backfills all of them
+    _, sources = load_state()
+    new_files = [f for f in sorted(glob.glob(pattern)) if os.path.basename(f) not in sources]
+    print(f"{len(new_files)} new snapshots to score")
+    for filepath in new_files:
+        update_anomalies(filepath)
+
+    if os.path.exists(ANOMALIES_PATH):
+        anomalies = pd.read_csv(ANOMALIES_PATH)
+        print(f"\n{len(anomalies)} anomalies recorded; most recent:")
+        print(anomalies.tail(10)[['city', 'country', 'collection_timestamp', 'aqi', 'baseline_median',
+                                  'robust_score', 'direction']].to_string(index=False))
+
+    print("\n=== Anomaly Detection Complete ===")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Pipeline Scaling Benchmark
+Times each cleaning, integration and analysis stage on synthetic data of
+increasing size, records peak memory, and compares against a stored baseline
+"""
+
+import matplotlib
+matplotlib.use('Agg')
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import clean_and_integrate as ci
+import analysis_and_viz as av
+from full_collection import curation_log
+from synthetic_data import generate_pipeline_inputs
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+BASELINE_PATH = 'data/benchmark_baseline.json'
+
+# A stage regresses if it is this much slower / hungrier than the baseline
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.25
+
+# Timing passes per size; like timeit, the fastest pass is recorded since slower ones are noise
+DEFAULT_REPEAT = 3
+
+def pipeline_stages():
+    """Ordered (name, function) pairs; each function updates the shared state dict"""
+    def standardize(state):
+        state['cities'], state['aq'] = ci.standardize_column_names(state['cities'], state['aq'])
+        state['cities'], state['aq'] = ci.standardize_data_types(state['cities'], state['aq'])
+
+    def missing(state):
+        state['aq'] = ci.handle_missing_values(state['aq'])
+
+    def integrate(state):
+        state['integrated'] = ci.integrate_datasets(state['cities'], state['aq'])
+
+    def validate(state):
+        state['integrated'] = ci.validate_integrated_data(state['integrated'])
+
+    def final(state):
+        state['final'] = ci.create_final_dataset(state['integrated'])
+
+    def descriptive(state):
+        state['with_aqi'] = av.compute_descriptive_statistics(state['final'])
+
+    def correlations(state):
+        av.assess_correlations(state['with_aqi'])
+
+    def outliers(state):
+        av.identify_outliers(state['final'])
+
+    def regional(state):
+        av.regional_comparison(state['final'])
+
+    def visualizations(state):
+        av.create_visualizations(state['final'])
+
+    return [
+        ('standardize_data_types', standardize),
+        ('handle_missing_values', missing),
+        ('integrate_datasets', integrate),
+        ('validate_integrated_data', validate),
+        ('create_final_dataset', final),
+        ('compute_descriptive_statistics', descriptive),
+        ('assess_correlations', correlations),
+        ('identify_outliers', outliers),
+        ('regional_comparison', regional),
+        ('create_visualizations', visualizations)
+    ]
+
+def run_pipeline(cities, raw_aq, skip=(), trace_memory=False):
+    """Run every stage quietly on fresh copies of the inputs, returning per-stage measurements"""
+    state = {'cities': cities.copy(), 'aq': raw_aq.copy()}
+    measurements = {}
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        for name, func in pipeline_stages():
+            if name in skip:
+                continue
+            if trace_memory:
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                func(state)
+            elapsed = time.perf_counter() - start
+            if trace_memory:
+                measurements[name] = tracemalloc.get_traced_memory()[1] / 2**20
+            else:
+                measurements[name] = elapsed
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        # Stages append to the shared curation log; keep it from growing across runs
+        curation_log.clear()
+    return measurements
+
+def benchmark_size(num_rows, seed=42, skip=(), repeat=DEFAULT_REPEAT):
+    """Benchmark every stage on one synthetic dataset size, keeping each stage's fastest of repeat passes"""
+    cities, raw_aq = generate_pipeline_inputs(num_rows, seed=seed)
+
+    # tracemalloc slows allocation-heavy stages a lot, so time and trace in separate passes
+    passes = [run_pipeline(cities, raw_aq, skip=skip) for _ in range(max(repeat, 1))]
+    seconds = {name: min(p[name] for p in passes) for name in passes[0]}
+    peak_mb = run_pipeline(cities, raw_aq, skip=skip, trace_memory=True)
+
+    results = {}
+    for name in seconds:
+        results[name] = {'seconds': round(seconds[name], 4), 'peak_mb': round(peak_mb[name], 2)}
+        print(f"  {name:<32} {seconds[name]:9.3f}s {peak_mb[name]:10.1f} MB")
+    return results
+
+def run_benchmark(sizes=DEFAULT_SIZES, seed=42, skip=(), repeat=DEFAULT_REPEAT):
+    """Benchmark all sizes in a scratch directory so real data/ outputs are untouched"""
+    results = {
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seed': seed,
+        'repeat': repeat,
+        'sizes': {}
+    }
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        os.makedirs('data/viz', exist_ok=True)
+        try:
+            for num_rows in sizes:
+                print(f"\n{num_rows:,} rows")
+                results['sizes'][str(num_rows)] = benchmark_size(num_rows, seed=seed, skip=skip, repeat=repeat)
+        finally:
+            os.chdir(original_dir)
+    return results
+
+def compare_to_baseline(results, baseline):
+    """List stages slower or hungrier than the baseline beyond tolerance"""
+    regressions = []
+    for size, stages in results['sizes'].items():
+        for name, current in stages.items():
+            previous = baseline.get('sizes', {}).get(size, {}).get(name)
+            if previous is None:
+                continue
+            for metric, tolerance in [('seconds', TIME_TOLERANCE), ('peak_mb', MEMORY_TOLERANCE)]:
+                # Ignore noise on stages too small to measure reliably
+                floor = 0.05 if metric == 'seconds' else 1.0
+                if current[metric] > max(previous[metric], floor) * (1 + tolerance):
+                    regressions.append({
+                        'size': size,
+                        'stage': name,
+                        'metric': metric,
+                        'baseline': previous[metric],
+                        'current': current[metric],
+                        'ratio': round(current[metric] / max(previous[metric], 1e-9), 2)
+                    })
+    return regressions
+
+def confirm_regressions(results, baseline, regressions, seed=42, skip=(), repeat=DEFAULT_REPEAT):
+    """Re-time the sizes that regressed and keep only regressions that hold on the best of both rounds"""
+    sizes = sorted({int(r['size']) for r in regressions})
+    print(f"\n{len(regressions)} possible regressions; re-timing {', '.join(f'{s:,}' for s in sizes)} rows to confirm")
+    retry = run_benchmark(sizes, seed=seed, skip=skip, repeat=repeat)
+    for size, stages in retry['sizes'].items():
+        for name, measured in stages.items():
+            current = results['sizes'][size][name]
+            for metric in measured:
+                current[metric] = min(current[metric], measured[metric])
+    return compare_to_baseline(results, baseline)
+
+def warn_if_environment_differs(results, baseline):
+    """Timings only compare like with like; flag a baseline from another machine or Python"""
+    for field in ['machine', 'platform', 'cpus', 'python']:
+        if results.get(field) != baseline.get(field):
+            print(f"WARNING: baseline {field} is {baseline.get(field)}, this run is {results.get(field)}; "
+                  f"timings may not be comparable")
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description='Benchmark pipeline stages on synthetic data')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='comma-separated row counts')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip', default='', help='comma-separated stage names to skip')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='timing passes per size; the fastest is recorded')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='save these results as the new baseline (required to create one)')
+    args = parser.parse_args()
+
+    if not args.update_baseline and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 2
+
+    print("=== Pipeline Scaling Benchmark ===")
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    skip = {s for s in args.skip.split(',') if s}
+    results = run_benchmark(sizes, seed=args.seed, skip=skip, repeat=args.repeat)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved baseline: {args.baseline}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    warn_if_environment_differs(results, baseline)
+    regressions = compare_to_baseline(results, baseline)
+    if regressions:
+        # A single breach is often just a noisy round; only report it if it repeats
+        regressions = confirm_regressions(results, baseline, regressions, seed=args.seed, skip=skip, repeat=args.repeat)
+    if not regressions:
+        print(f"\nNo regressions against {args.baseline}")
+        return 0
+
+    print(f"\n{len(regressions)} regressions against {args.baseline}:")
+    for r in regressions:
+        print(f"  {r['size']:>8} rows  {r['stage']:<32} {r['metric']:<8} "
+              f"{r['baseline']} -> {r['current']} ({r['ratio']}x)")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,10 +5,21 @@ Standardizes field names, formats, and integrates datasets
 
 import pandas as pd
 import numpy as np
+import os
 from datetime import datetime
 
 # Import logging function
 from full_collection import curation_log, log_step
+from aggregation_cube import update_cube
+
+# Column order of the final integrated dataset
+FINAL_COLUMN_ORDER = [
+    'city', 'country', 'iso2', 'iso3',
+    'latitude', 'longitude',
+    'population',
+    'aqi', 'aqi_category', 'dominant_pollutant',
+    'data_quality_flag', 'collection_timestamp'
+]
 
 def load_data_for_cleaning():
     """Load raw data for cleaning"""
@@ -172,22 +183,17 @@ def validate_integrated_data(integrated_data):
 def create_final_dataset(integrated_data):
     """Create final clean, integrated CSV file"""
     # Reorder columns
-    column_order = [
-        'city', 'country', 'iso2', 'iso3',
-        'latitude', 'longitude',
-        'population',
-        'aqi', 'aqi_category', 'dominant_pollutant',
-        'data_quality_flag', 'collection_timestamp'
-    ]
-    
-    final_data = integrated_data[column_order]
+    final_data = integrated_data[FINAL_COLUMN_ORDER]
     
     print(f"Final shape: {final_data.shape}")
     print(final_data.head())
     
     # Save final integrated dataset
     final_filename = 'data/integrated_cities_air_quality_final.csv'
-    final_data.to_csv(final_filename, index=False)
+    # Write aside and swap in, so readers such as query_service never see a half-written file
+    temp_filename = f'{final_filename}.tmp'
+    final_data.to_csv(temp_filename, index=False)
+    os.replace(temp_filename, final_filename)
     
     print(f"Saved: {final_filename}")
     log_step('Final Dataset', f'Created final integrated dataset: {final_filename}')
@@ -231,6 +237,9 @@ def main():
     # Create final dataset
     final_data = create_final_dataset(integrated_data)
     
+    # Fold this snapshot into the rollup cube
+    update_cube(final_data)
+    
     # Export curation log
     export_curation_log()
     
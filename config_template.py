@@ -6,6 +6,12 @@ Configuration file for API keys and settings
 API_KEY = "API KEY GOES HERE"  # Replace with your actual API key
 BASE_URL = "https://airquality.googleapis.com/v1/"
 
+# Optional pool of keys (e.g. one per project); requests are spread across them.
+# Leave empty to use API_KEY alone.
+API_KEYS = []
+REQUESTS_PER_MINUTE_PER_KEY = 240  # 0.25s between requests on each key
+DAILY_QUOTA_PER_KEY = None  # Set to retire a key once it has made this many requests
+
 # Data paths
 DATA_DIR = "data"
 RAW_DATA_DIR = "data/raw"
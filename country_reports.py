@@ -0,0 +1,251 @@
+"""
+Per-Country Report Generator
+Partitions the final dataset by country and renders an AQI report for each
+country on a process pool, rebuilding only countries whose data changed
+"""
+
+import matplotlib
+matplotlib.use('Agg')
+
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from full_collection import log_step
+
+REPORTS_DIR = 'data/reports'
+MANIFEST_NAME = 'manifest.json'
+
+# Bump when the report layout changes so every country is rebuilt
+REPORT_VERSION = 2
+
+# Number of cities shown in the ranking chart (the CSV has all of them)
+RANKING_LENGTH = 15
+
+# The world inset draws every city snapped to this grid, so new cities rarely change it
+WORLD_GRID_DEGREES = 2
+
+# Share of the map height kept free of cities at the bottom for the world inset
+INSET_BAND = 0.25
+
+def report_key(iso3):
+    """Filesystem-safe directory name for a country"""
+    return re.sub(r'[^A-Za-z0-9_-]', '_', str(iso3))
+
+def partition_by_country(df):
+    """Split the final dataset into one slice per country in a single groupby pass"""
+    # Countries without an ISO3 code fall back to their name
+    keys = df['iso3'].fillna(df['country']).map(report_key)
+    slices = {key: group.reset_index(drop=True) for key, group in df.groupby(keys, sort=True)}
+    log_step('Country Reports - Partition', f'{len(df)} cities in {len(slices)} countries')
+    return slices
+
+def world_backdrop(df):
+    """All city locations snapped to a coarse grid, drawn in grey behind each country's world inset"""
+    coords = df[['longitude', 'latitude']].dropna()
+    cells = (coords / WORLD_GRID_DEGREES).round() * WORLD_GRID_DEGREES
+    return cells.drop_duplicates().sort_values(['longitude', 'latitude']).reset_index(drop=True)
+
+def slice_hash(country_df, backdrop_hash):
+    """Content hash of a country's slice (plus the report version and the world backdrop)"""
+    payload = f'{REPORT_VERSION}\n{backdrop_hash}\n' + country_df.to_csv(index=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def summarize_country(key, country_df):
+    """One index-page row for a country"""
+    with_aqi = country_df[country_df['aqi'].notna()]
+    worst = with_aqi.nsmallest(1, 'aqi')
+    pollutants = with_aqi['dominant_pollutant'].dropna()
+    return {
+        'key': key,
+        'country': country_df['country'].iloc[0],
+        'cities': len(country_df),
+        'cities_with_aqi': len(with_aqi),
+        'population': country_df['population'].sum(),
+        # Higher UAQI means cleaner air, so the lowest reading is the worst city
+        'mean_aqi': round(with_aqi['aqi'].mean(), 1) if len(with_aqi) > 0 else np.nan,
+        'worst_city': worst['city'].iloc[0] if len(worst) > 0 else '',
+        'worst_aqi': worst['aqi'].iloc[0] if len(worst) > 0 else np.nan,
+        'main_pollutant': pollutants.mode().iloc[0] if len(pollutants) > 0 else ''
+    }
+
+def city_ranking(country_df):
+    """Cities ordered from worst to best air quality"""
+    columns = ['city', 'population', 'aqi', 'aqi_category', 'dominant_pollutant']
+    ranking = country_df.sort_values(['aqi', 'population'], ascending=[True, False], na_position='last')[columns]
+    ranking.insert(0, 'rank', np.arange(1, len(ranking) + 1))
+    return ranking.reset_index(drop=True)
+
+def plot_country(country_df, country_name, filepath, backdrop):
+    """Four-panel figure: AQI distribution, city ranking, pollutant breakdown and map with world inset"""
+    with_aqi = country_df[country_df['aqi'].notna()]
+    # A fixed layout; tight_layout and bbox_inches='tight' were most of the render time
+    fig, axes = plt.subplots(2, 2, figsize=(14, 10))
+    fig.subplots_adjust(left=0.12, right=0.97, bottom=0.07, top=0.92, wspace=0.3, hspace=0.3)
+    fig.suptitle(f'{country_name}: air quality in {len(country_df)} cities', fontsize=14)
+
+    # A: AQI distribution
+    ax = axes[0, 0]
+    if len(with_aqi) > 0:
+        ax.hist(with_aqi['aqi'], bins=np.arange(0, 105, 5), color='steelblue', alpha=0.7, edgecolor='black')
+    else:
+        ax.text(0.5, 0.5, 'No AQI readings', ha='center', va='center', transform=ax.transAxes)
+    ax.set_xlim(0, 100)
+    ax.set_xlabel('Air Quality Index (AQI)')
+    ax.set_ylabel('Cities')
+    ax.set_title('AQI Distribution')
+    ax.grid(axis='y', alpha=0.3)
+
+    # B: City ranking, worst first
+    ax = axes[0, 1]
+    ranked = with_aqi.nsmallest(RANKING_LENGTH, 'aqi')
+    ax.barh(ranked['city'], ranked['aqi'], color=plt.cm.RdYlGn(ranked['aqi'] / 100), edgecolor='black')
+    ax.invert_yaxis()
+    ax.set_xlim(0, 100)
+    ax.set_xlabel('Air Quality Index (AQI)')
+    ax.set_title(f'Lowest AQI Cities (top {min(RANKING_LENGTH, len(ranked))})')
+    ax.grid(axis='x', alpha=0.3)
+
+    # C: Pollutant breakdown
+    ax = axes[1, 0]
+    pollutants = country_df['dominant_pollutant'].fillna('missing').value_counts()
+    ax.bar(pollutants.index, pollutants.values, color='coral', alpha=0.7, edgecolor='black')
+    ax.set_xlabel('Dominant Pollutant')
+    ax.set_ylabel('Cities')
+    ax.set_title('Dominant Pollutant Breakdown')
+    ax.grid(axis='y', alpha=0.3)
+
+    # D: City map, sized by population, with the country's extent on a world inset
+    ax = axes[1, 1]
+    located = country_df[country_df['latitude'].notna() & country_df['longitude'].notna()]
+    scatter = ax.scatter(located['longitude'], located['latitude'], c=located['aqi'],
+                         s=np.clip(located['population'] / 100000, 10, 400), cmap='RdYlGn',
+                         vmin=0, vmax=100, alpha=0.7, edgecolors='black', linewidth=0.5)
+    fig.colorbar(scatter, ax=ax, label='Air Quality Index (AQI)')
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    ax.set_title('City Locations (Size = Population, Color = AQI)')
+    ax.grid(alpha=0.3, linestyle='--')
+
+    if len(located) > 0:
+        lon_min, lon_max = located['longitude'].min(), located['longitude'].max()
+        lat_min, lat_max = located['latitude'].min(), located['latitude'].max()
+        # Pad so single-city countries still get a readable frame
+        pad = max(1.0, 0.1 * max(lon_max - lon_min, lat_max - lat_min))
+        ax.set_xlim(lon_min - pad, lon_max + pad)
+        # Extend the map downwards so the inset sits in a band with no cities
+        top = lat_max + pad
+        ax.set_ylim(top - (top - lat_min + pad) / (1 - INSET_BAND), top)
+
+        inset = ax.inset_axes([0.68, 0.02, 0.3, 0.2])
+        inset.scatter(backdrop['longitude'], backdrop['latitude'], s=1, color='grey', linewidth=0)
+        inset.scatter(located['longitude'], located['latitude'], s=2, color='red', linewidth=0)
+        inset.set_xlim(-180, 180)
+        inset.set_ylim(-90, 90)
+        inset.set_xticks([])
+        inset.set_yticks([])
+        inset.set_facecolor('aliceblue')
+        inset.add_patch(plt.Rectangle((lon_min - pad, lat_min - pad), lon_max - lon_min + 2 * pad,
+                                      lat_max - lat_min + 2 * pad, fill=False, edgecolor='red', linewidth=1.5))
+
+    fig.savefig(filepath, dpi=100)
+    plt.close(fig)
+
+def write_country_page(country_name, ranking, page_path):
+    """HTML page with the figure and full city ranking"""
+    with open(page_path, 'w', encoding='utf-8') as f:
+        f.write(f'<html><head><meta charset="utf-8"><title>{html.escape(country_name)} air quality</title></head><body>\n')
+        f.write(f'<p><a href="../index.html">All countries</a></p>\n<h1>{html.escape(country_name)}</h1>\n')
+        f.write('<img src="report.png" width="100%">\n<h2>City ranking (lowest AQI first)</h2>\n')
+        f.write(ranking.to_html(index=False, na_rep=''))
+        f.write('\n</body></html>\n')
+
+def render_country_report(task):
+    """Render one country's bundle (figure, ranking CSV, page); runs in a worker process"""
+    key, country_df, backdrop, output_dir = task
+    country_name = country_df['country'].iloc[0]
+    country_dir = os.path.join(output_dir, key)
+    os.makedirs(country_dir, exist_ok=True)
+
+    ranking = city_ranking(country_df)
+    ranking.to_csv(os.path.join(country_dir, 'cities.csv'), index=False)
+    plot_country(country_df, country_name, os.path.join(country_dir, 'report.png'), backdrop)
+    write_country_page(country_name, ranking, os.path.join(country_dir, 'index.html'))
+    return key
+
+def write_index_page(summaries, output_dir):
+    """Index page linking every country report"""
+    index = pd.DataFrame(summaries).sort_values('country')
+    index['country'] = [f'<a href="{key}/index.html">{html.escape(name)}</a>'
+                        for key, name in zip(index['key'], index['country'])]
+    index['worst_city'] = index['worst_city'].map(html.escape)
+    index = index.drop(columns='key')
+
+    index_path = os.path.join(output_dir, 'index.html')
+    with open(index_path, 'w', encoding='utf-8') as f:
+        f.write('<html><head><meta charset="utf-8"><title>Air quality by country</title></head><body>\n')
+        f.write(f'<h1>Air quality by country</h1>\n<p>{len(index)} countries, '
+                f'{int(index["cities"].sum())} cities. Higher AQI means cleaner air.</p>\n')
+        f.write(index.to_html(index=False, escape=False, na_rep=''))
+        f.write('\n</body></html>\n')
+    return index_path
+
+def load_manifest(output_dir):
+    """Slice hashes from the previous build"""
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def build_country_reports(df, output_dir=REPORTS_DIR, max_workers=None, force=False):
+    """Render reports for countries whose slice changed, drop removed countries, and rewrite the index"""
+    os.makedirs(output_dir, exist_ok=True)
+    slices = partition_by_country(df)
+    previous = load_manifest(output_dir)
+
+    backdrop = world_backdrop(df)
+    backdrop_hash = hashlib.sha256(backdrop.to_csv(index=False).encode('utf-8')).hexdigest()
+    hashes = {key: slice_hash(country_df, backdrop_hash) for key, country_df in slices.items()}
+    changed = [key for key in slices
+               if force or previous.get(key) != hashes[key]
+               or not os.path.exists(os.path.join(output_dir, key, 'report.png'))]
+
+    start = time.time()
+    if changed:
+        tasks = [(key, slices[key], backdrop, output_dir) for key in changed]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for _ in executor.map(render_country_report, tasks, chunksize=4):
+                pass
+
+    # Countries that left the dataset lose their reports
+    removed = [key for key in previous if key not in slices]
+    for key in removed:
+        shutil.rmtree(os.path.join(output_dir, key), ignore_errors=True)
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(hashes, f, indent=2)
+    index_path = write_index_page([summarize_country(key, s) for key, s in slices.items()], output_dir)
+
+    log_step('Country Reports', f'Rendered {len(changed)} countries in {time.time() - start:.1f}s, '
+             f'{len(slices) - len(changed)} unchanged, {len(removed)} removed; index: {index_path}')
+    return changed
+
+def main(force=False):
+    """Main execution function"""
+    print("=== Per-Country Report Generator ===\n")
+
+    df = pd.read_csv('data/integrated_cities_air_quality_final.csv')
+    build_country_reports(df, force=force)
+
+    print("\n=== Country Reports Complete ===")
+
+if __name__ == "__main__":
+    main()
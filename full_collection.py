@@ -6,14 +6,62 @@ Executes large-scale API data collection for all 500 cities with error handling
 import pandas as pd
 import numpy as np
 import requests
+import argparse
+import glob
 import json
+import os
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from config_template import API_KEY, BASE_URL
+from config_template import API_KEY, API_KEYS, BASE_URL, REQUESTS_PER_MINUTE_PER_KEY, DAILY_QUOTA_PER_KEY
 
 # Create log list to track all operations
 curation_log = []
 
+# Hedged requests: a second copy is sent once the first passes the observed p95 latency
+request_latencies = deque(maxlen=200)
+hedge_stats = {'requests': 0, 'hedged': 0}
+hedge_executor = ThreadPoolExecutor(max_workers=32)
+# Collection runs 2 workers per key and each can have a request plus its hedge in flight
+HEDGE_THREADS_PER_KEY = 4
+HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_DELAY = 2.0
+# Every hedge is a billed call, so at most this fraction of requests may be hedged
+HEDGE_MAX_FRACTION = 0.05
+
+# Circuit breaker: pause dispatch after consecutive failures, then probe before resuming
+circuit_breaker = {'state': 'closed', 'consecutive_failures': 0, 'opened_at': None, 'probe_started': None,
+                   'probe_thread': None, 'announced_at': None}
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOLDOWN = 30
+# A probe that has not resolved the breaker by then (e.g. it was retried on another key) is replaced
+CIRCUIT_PROBE_TIMEOUT = 60
+
+# Shared request state is updated from collection worker threads
+state_lock = threading.Lock()
+
+# Credential pool: one entry per API key, each paced to its own per-minute quota
+key_pool = []
+pool_lock = threading.Lock()
+RATE_LIMIT_COOLDOWN = 60
+
+# Collection planner: stats from the last run drive the time/call estimates
+COLLECTION_STATS_PATH = 'data/collection_stats.json'
+DEFAULT_LATENCY = 0.5
+DEFAULT_CALLS_PER_CITY = 1.05
+# Most physical calls one city can use: every retry attempt plus its hedge
+MAX_CALLS_PER_CITY = 6
+# Priority = population + staleness - recent errors; staleness saturates after a day
+PRIORITY_WEIGHTS = {'population': 1.0, 'staleness': 1.0, 'errors': 0.5}
+STALENESS_HORIZON = 24 * 3600
+ERROR_HISTORY_RUNS = 5
+
+def seconds_left(deadline):
+    """Seconds until a deadline (epoch seconds); infinite when there is none"""
+    return float('inf') if deadline is None else deadline - time.time()
+
 def log_step(step_name, details):
     """Log a curation step with timestamp"""
     timestamp = datetime.now().isoformat()
@@ -70,8 +118,8 @@ def validate_simplemaps_data(filepath='data/worldcities.csv'):
     
     return cities_df
 
-def select_top_500_cities(cities_df):
-    """Select top 500 cities by population"""
+def select_top_500_cities(cities_df, save=True):
+    """Select top 500 cities by population, saving them unless save is False"""
     valid_cities = cities_df[
         (cities_df['population'].notna()) &
         (cities_df['lat'].notna()) &
@@ -84,15 +132,260 @@ def select_top_500_cities(cities_df):
     print(top_500_cities[['city', 'country', 'population']].head(10))
     
     # Save validated top 500 cities
-    top_500_cities.to_csv('data/raw_top_500_cities.csv', index=False)
-    log_step('Data Selection', 'Selected and saved top 500 cities by population')
+    if save:
+        top_500_cities.to_csv('data/raw_top_500_cities.csv', index=False)
+        log_step('Data Selection', 'Selected and saved top 500 cities by population')
     
     return top_500_cities
 
-def get_current_air_quality(lat, lon, api_key, retry_count=3):
-    """Get current air quality with retry logic and error handling"""
+def init_credential_pool(api_keys, requests_per_minute=REQUESTS_PER_MINUTE_PER_KEY, daily_quota=DAILY_QUOTA_PER_KEY):
+    """Create per-key state: pacing, quota counter and usage stats, and size the request executor to the pool"""
+    global hedge_executor
+    with pool_lock:
+        key_pool.clear()
+        for i, key in enumerate(api_keys):
+            key_pool.append({
+                'label': f'key_{i + 1}',
+                'key': key,
+                'spacing': 60 / requests_per_minute,
+                'daily_quota': daily_quota,
+                'next_allowed': 0.0,
+                'in_flight': 0,
+                'disabled': False,
+                # Daily quota state; the counter restarts when the date changes
+                'quota_day': datetime.now().date(),
+                'day_requests': 0,
+                'quota_exhausted': False,
+                'requests': 0,
+                'successes': 0,
+                'rate_limited': 0,
+                'forbidden': 0,
+                'errors': 0
+            })
+    
+    # A fixed-size executor would queue requests (with their hedge timers running) once the pool grows
+    old_executor = hedge_executor
+    hedge_executor = ThreadPoolExecutor(max_workers=max(32, HEDGE_THREADS_PER_KEY * len(api_keys)))
+    old_executor.shutdown(wait=False)
+    return key_pool
+
+def refresh_daily_quota(state, today):
+    """Start a new quota day for a key; call with pool_lock held"""
+    if state['quota_day'] != today:
+        state['quota_day'] = today
+        state['day_requests'] = 0
+        state['quota_exhausted'] = False
+
+def key_in_rotation(state, today):
+    """Whether a key can take requests today, retiring it for the day once its quota is used up; call with pool_lock held"""
+    if state['disabled']:
+        return False
+    refresh_daily_quota(state, today)
+    if not state['quota_exhausted'] and state['daily_quota'] is not None and state['day_requests'] >= state['daily_quota']:
+        state['quota_exhausted'] = True
+        log_step('Credential Pool', f"{state['label']} reached its daily quota of {state['daily_quota']} requests")
+    return not state['quota_exhausted']
+
+def usable_key_count():
+    """Number of keys still in rotation today"""
+    today = datetime.now().date()
+    with pool_lock:
+        return sum(key_in_rotation(state, today) for state in key_pool)
+
+def acquire_key(deadline=None):
+    """Reserve the least-loaded usable key, waiting for its pacing slot if every key is busy
+
+    Raises TimeoutError instead of waiting for a slot that only frees up after the deadline.
+    """
+    while True:
+        with pool_lock:
+            now = time.time()
+            today = datetime.now().date()
+            usable = [state for state in key_pool if key_in_rotation(state, today)]
+            
+            if not usable:
+                raise RuntimeError('All API keys are exhausted or rejected')
+            
+            # Least loaded = earliest free pacing slot, then fewest requests in flight
+            best = min(usable, key=lambda s: (max(s['next_allowed'], now), s['in_flight']))
+            if best['next_allowed'] <= now:
+                best['next_allowed'] = now + best['spacing']
+                best['in_flight'] += 1
+                best['requests'] += 1
+                best['day_requests'] += 1
+                return best
+            delay = best['next_allowed'] - now
+        if delay >= seconds_left(deadline):
+            raise TimeoutError('Deadline passed while waiting for an API key')
+        time.sleep(delay)
+
+def release_key(state, status_code=None):
+    """Record the outcome of a request made with a key; None means no response came back"""
+    with pool_lock:
+        state['in_flight'] -= 1
+        if status_code == 200:
+            state['successes'] += 1
+        elif status_code == 429:
+            # Rest the key until its per-minute quota resets
+            state['rate_limited'] += 1
+            state['next_allowed'] = max(state['next_allowed'], time.time() + RATE_LIMIT_COOLDOWN)
+        elif status_code == 403:
+            state['forbidden'] += 1
+            state['disabled'] = True
+        else:
+            state['errors'] += 1
+    if status_code == 403:
+        log_step('Credential Pool', f"{state['label']} rejected (403), removed from rotation")
+
+def pool_request_count():
+    """Total requests made through the pool so far"""
+    with pool_lock:
+        return sum(state['requests'] for state in key_pool)
+
+def report_key_usage():
+    """Per-key usage summary for the end of a run"""
+    with pool_lock:
+        usage = pd.DataFrame([{
+            'key': state['label'],
+            'key_suffix': state['key'][-4:],
+            'requests': state['requests'],
+            'successes': state['successes'],
+            'rate_limited': state['rate_limited'],
+            'forbidden': state['forbidden'],
+            'errors': state['errors'],
+            'today_requests': state['day_requests'],
+            'status': 'disabled' if state['disabled'] else 'quota exhausted' if state['quota_exhausted'] else 'active'
+        } for state in key_pool])
+    print(usage.to_string(index=False))
+    log_step('Credential Pool Usage', f"{len(usage)} keys, {int(usage['requests'].sum())} requests, "
+             f"{int((usage['status'] == 'disabled').sum())} keys disabled, "
+             f"{int((usage['status'] == 'quota exhausted').sum())} at today's quota")
+    return usage
+
+def get_hedge_delay():
+    """Observed p95 request latency, or a default until enough requests have been timed"""
+    if len(request_latencies) < HEDGE_MIN_SAMPLES:
+        return DEFAULT_HEDGE_DELAY
+    return float(np.percentile(request_latencies, 95))
+
+def timed_post(url, data, api_key, key_state=None):
+    """POST a request and return the response with its latency, releasing the pool key if one was used"""
+    status_code = None
+    start = time.time()
+    try:
+        response = requests.post(url, params={"key": api_key}, json=data, timeout=10)
+        status_code = response.status_code
+    finally:
+        # Every copy's own latency is recorded, including losers and failures, so slow
+        # requests are not censored out of the p95
+        latency = time.time() - start
+        request_latencies.append(latency)
+        if key_state is not None:
+            release_key(key_state, status_code)
+    return response, latency
+
+def submit_post(url, data, api_key=None, deadline=None):
+    """Start a timed request on the given key, or on a pool key once its pacing slot is free"""
+    # Wait for the key before submitting so queueing for a slot doesn't count as request latency
+    key_state = acquire_key(deadline) if api_key is None else None
+    key = api_key if key_state is None else key_state['key']
+    return hedge_executor.submit(timed_post, url, data, key, key_state)
+
+def hedged_post(url, data, api_key=None, deadline=None):
+    """Send a request, plus a second copy if the first is slower than p95; use whichever returns first"""
+    futures = [submit_post(url, data, api_key, deadline)]
+    with state_lock:
+        hedge_stats['requests'] += 1
+    
+    done, _ = wait(futures, timeout=get_hedge_delay())
+    if not done:
+        with state_lock:
+            within_budget = hedge_stats['hedged'] < HEDGE_MAX_FRACTION * hedge_stats['requests']
+            if within_budget:
+                hedge_stats['hedged'] += 1
+        if within_budget:
+            # The hedge may go out on a different pool key
+            try:
+                futures.append(submit_post(url, data, api_key, deadline))
+            except TimeoutError:
+                # No key frees up before the deadline; the first copy is still in flight
+                pass
+    
+    pending = set(futures)
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response, _ = future.result()
+            except Exception as e:
+                # Only give up once every copy has failed
+                error = e
+                continue
+            return response
+    raise error
+
+def wait_for_circuit(deadline=None):
+    """Pause dispatch while the circuit is open; after the cooldown one thread probes and the rest wait for it
+
+    Returns False if the deadline passes before this thread may send a request.
+    """
+    while True:
+        with state_lock:
+            now = time.time()
+            if circuit_breaker['state'] == 'closed':
+                return True
+            if circuit_breaker['state'] == 'half_open' and circuit_breaker['probe_thread'] == threading.get_ident():
+                # The probe is retrying without a verdict (e.g. its key was rotated out on a 403)
+                circuit_breaker['probe_started'] = now
+                return True
+            if seconds_left(deadline) <= 0:
+                return False
+            announce = False
+            if circuit_breaker['state'] == 'open':
+                remaining = circuit_breaker['opened_at'] + CIRCUIT_COOLDOWN - now
+                # Announce each opening once, not once per waiting thread
+                announce = circuit_breaker['announced_at'] != circuit_breaker['opened_at']
+                circuit_breaker['announced_at'] = circuit_breaker['opened_at']
+            else:
+                remaining = circuit_breaker['probe_started'] + CIRCUIT_PROBE_TIMEOUT - now
+            if remaining <= 0:
+                # This thread is the probe; the others stay here until it resolves the breaker
+                circuit_breaker['state'] = 'half_open'
+                circuit_breaker['probe_started'] = now
+                circuit_breaker['probe_thread'] = threading.get_ident()
+                return True
+        if announce and remaining > 0:
+            print(f"Circuit open, pausing {remaining:.0f}s before probing")
+        time.sleep(max(min(remaining, 0.5, seconds_left(deadline)), 0))
+
+def record_request_outcome(success):
+    """Update the circuit breaker after a request"""
+    with state_lock:
+        if success:
+            if circuit_breaker['state'] != 'closed':
+                log_step('Circuit Breaker', 'Probe succeeded, resuming collection')
+            circuit_breaker['state'] = 'closed'
+            circuit_breaker['consecutive_failures'] = 0
+            return
+    
+        circuit_breaker['consecutive_failures'] += 1
+        if circuit_breaker['state'] == 'half_open' or circuit_breaker['consecutive_failures'] >= CIRCUIT_FAILURE_THRESHOLD:
+            if circuit_breaker['state'] == 'half_open':
+                log_step('Circuit Breaker', 'Probe failed, pausing again')
+            elif circuit_breaker['state'] == 'closed':
+                log_step('Circuit Breaker', f"Opened after {circuit_breaker['consecutive_failures']} consecutive failures")
+            circuit_breaker['state'] = 'open'
+            circuit_breaker['opened_at'] = time.time()
+
+def get_current_air_quality(lat, lon, api_key=None, retry_count=3, deadline=None):
+    """Get current air quality with retry logic, hedged requests and a circuit breaker
+
+    Without an explicit api_key each request takes the least-loaded key from the credential pool.
+    Once the deadline (epoch seconds) passes no new attempt starts and no key, circuit or backoff
+    wait continues; a request already sent still finishes within its own timeout.
+    """
     url = f"{BASE_URL}currentConditions:lookup"
-    params = {"key": api_key}
     data = {
         "location": {
             "latitude": lat,
@@ -101,104 +394,310 @@ def get_current_air_quality(lat, lon, api_key, retry_count=3):
     }
     
     for attempt in range(retry_count):
+        if seconds_left(deadline) <= 0:
+            return {'status': 'error', 'error_type': 'deadline'}
+        if api_key is None and usable_key_count() == 0:
+            return {'status': 'error', 'error_type': 'no_api_key'}
+        if not wait_for_circuit(deadline):
+            return {'status': 'error', 'error_type': 'deadline'}
         try:
-            response = requests.post(url, params=params, json=data, timeout=10)
+            response = hedged_post(url, data, api_key, deadline)
             
             if response.status_code == 200:
+                record_request_outcome(True)
                 return {'status': 'success', 'data': response.json()}
             elif response.status_code == 429:
-                # Rate limit hit, wait longer
-                time.sleep(2 ** attempt)  # Exponential backoff
+                # Rate limit hit; pool keys rest on their own, a lone key backs off
+                record_request_outcome(False)
+                if api_key is not None or usable_key_count() <= 1:
+                    time.sleep(max(min(2 ** attempt, seconds_left(deadline)), 0))  # Exponential backoff
+                continue
+            elif response.status_code == 403 and api_key is None and usable_key_count() > 0:
+                # That key was rotated out of the pool; retry on another one
                 continue
             else:
+                # Server errors count against the upstream; other client errors mean it is responding
+                record_request_outcome(response.status_code < 500)
                 return {'status': 'error', 'error_type': 'http_error', 'code': response.status_code}
                 
         except requests.exceptions.Timeout:
+            record_request_outcome(False)
             if attempt < retry_count - 1:
-                time.sleep(1)
+                time.sleep(max(min(1, seconds_left(deadline)), 0))
                 continue
             return {'status': 'error', 'error_type': 'timeout'}
+        except TimeoutError:
+            # No key slot before the deadline; nothing was sent, so the circuit is untouched
+            return {'status': 'error', 'error_type': 'deadline'}
+        except RuntimeError:
+            # acquire_key found every key exhausted or rejected; again nothing was sent
+            return {'status': 'error', 'error_type': 'no_api_key'}
         except Exception as e:
+            record_request_outcome(False)
             return {'status': 'error', 'error_type': 'exception', 'message': str(e)}
     
     return {'status': 'error', 'error_type': 'max_retries'}
 
-def collect_all_air_quality_data(top_500_cities):
-    """Collect air quality data for all 500 cities"""
+def build_raw_record(city_name, country, lat, lon, result):
+    """Turn an API result into a raw air quality record (and error entry if it failed)"""
+    if result['status'] == 'success':
+        api_data = result['data']
+        
+        aqi = None
+        category = None
+        dominant_pollutant = None
+        
+        if 'indexes' in api_data and len(api_data['indexes']) > 0:
+            index_data = api_data['indexes'][0]
+            aqi = index_data.get('aqi', None)
+            category = index_data.get('category', None)
+            dominant_pollutant = index_data.get('dominantPollutant', None)
+        
+        record = {
+            'city': city_name,
+            'country': country,
+            'lat': lat,
+            'lon': lon,
+            'aqi': aqi,
+            'aqi_category': category,
+            'dominant_pollutant': dominant_pollutant,
+            'collection_timestamp': datetime.now().isoformat(),
+            'status': 'success'
+        }
+        return record, None
+    
+    # Error log
+    error_entry = {
+        'city': city_name,
+        'country': country,
+        'error_type': result.get('error_type', 'unknown'),
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    record = {
+        'city': city_name,
+        'country': country,
+        'lat': lat,
+        'lon': lon,
+        'aqi': None,
+        'aqi_category': None,
+        'dominant_pollutant': None,
+        'collection_timestamp': datetime.now().isoformat(),
+        'status': 'error'
+    }
+    return record, error_entry
+
+def load_city_history(top_cities, pattern='data/raw_air_quality_*.csv'):
+    """Last successful reading and recent error rate per city, from earlier raw snapshots"""
+    history = top_cities[['city', 'country']].copy()
+    history['last_success'] = pd.NaT
+    history['recent_error_rate'] = 0.0
+
+    raw_files = sorted(glob.glob(pattern))
+    if not raw_files:
+        return history
+
+    snapshots = pd.concat([pd.read_csv(f, usecols=['city', 'country', 'collection_timestamp', 'status']).assign(run=i)
+                           for i, f in enumerate(raw_files)], ignore_index=True)
+    snapshots['collection_timestamp'] = pd.to_datetime(snapshots['collection_timestamp'], format='ISO8601', errors='coerce')
+
+    last_success = snapshots[snapshots['status'] == 'success'].groupby(['city', 'country'])['collection_timestamp'].max()
+    recent = snapshots[snapshots['run'] >= len(raw_files) - ERROR_HISTORY_RUNS]
+    error_rate = (recent['status'] == 'error').groupby([recent['city'], recent['country']]).mean()
+
+    keys = pd.MultiIndex.from_frame(history[['city', 'country']])
+    history['last_success'] = last_success.reindex(keys).to_numpy()
+    history['recent_error_rate'] = error_rate.reindex(keys).fillna(0).to_numpy()
+    return history
+
+def prioritize_cities(top_cities, history, now=None):
+    """Order cities by population, staleness and recent errors, highest priority first"""
+    now = now or datetime.now()
+    plan = top_cities.copy()
+
+    log_pop = np.log10(plan['population'].clip(lower=1))
+    pop_range = log_pop.max() - log_pop.min()
+    plan['population_score'] = (log_pop - log_pop.min()) / pop_range if pop_range > 0 else 1.0
+
+    # Never-collected cities count as fully stale
+    age = (now - pd.to_datetime(history['last_success'])).dt.total_seconds().to_numpy()
+    plan['last_success'] = history['last_success'].to_numpy()
+    plan['staleness_score'] = np.where(np.isnan(age), 1.0, np.clip(age / STALENESS_HORIZON, 0, 1))
+
+    # Cities that keep failing are likely to waste budget again
+    plan['recent_error_rate'] = history['recent_error_rate'].to_numpy()
+    plan['priority'] = (PRIORITY_WEIGHTS['population'] * plan['population_score'] +
+                        PRIORITY_WEIGHTS['staleness'] * plan['staleness_score'] -
+                        PRIORITY_WEIGHTS['errors'] * plan['recent_error_rate'])
+    return plan.sort_values('priority', ascending=False, kind='stable').reset_index(drop=True)
+
+def load_collection_stats(filepath=COLLECTION_STATS_PATH):
+    """Latency and rate-limit stats saved by the previous collection run"""
+    if not os.path.exists(filepath):
+        return {}
+    with open(filepath) as f:
+        return json.load(f)
+
+def estimate_collection(num_cities, stats, max_workers):
+    """Estimate calls and wall time for a run from recent stats and the current key pool"""
+    latency = stats.get('mean_latency', DEFAULT_LATENCY)
+    calls_per_city = stats.get('calls_per_city', DEFAULT_CALLS_PER_CITY)
+    rate_limited_per_call = stats.get('rate_limited_per_call', 0.0)
+    num_keys = max(usable_key_count(), 1)
+    spacing = key_pool[0]['spacing'] if key_pool else 60 / REQUESTS_PER_MINUTE_PER_KEY
+
+    # Throughput is capped by key pacing or by worker latency, whichever is slower;
+    # each 429 also takes one key out for RATE_LIMIT_COOLDOWN
+    seconds_per_call = max(spacing / num_keys, latency / max_workers) + rate_limited_per_call * RATE_LIMIT_COOLDOWN / num_keys
+    estimate = {
+        'cities': num_cities,
+        'keys': num_keys,
+        'workers': max_workers,
+        'mean_latency': latency,
+        'calls_per_city': calls_per_city,
+        'rate_limited_per_call': rate_limited_per_call,
+        'seconds_per_city': seconds_per_call * calls_per_city,
+        'calls': int(np.ceil(num_cities * calls_per_city)),
+        'seconds': num_cities * seconds_per_call * calls_per_city,
+        'based_on': stats.get('timestamp', 'defaults')
+    }
+    log_step('Collection Estimate', f"{num_cities} cities: ~{estimate['calls']} calls, ~{estimate['seconds'] / 60:.1f} min "
+             f"({num_keys} keys, {max_workers} workers, stats from {estimate['based_on']})")
+    return estimate
+
+def cities_within_limits(estimate, deadline_minutes=None, max_calls=None):
+    """How many of the planned cities the estimate says fit in the deadline and call budget"""
+    planned = estimate['cities']
+    if deadline_minutes is not None:
+        planned = min(planned, int(deadline_minutes * 60 / estimate['seconds_per_city']))
+    if max_calls is not None:
+        planned = min(planned, int(max_calls / estimate['calls_per_city']))
+    if planned < estimate['cities']:
+        log_step('Collection Plan', f"Expect to reach {planned} of {estimate['cities']} cities "
+                 f"(deadline {deadline_minutes} min, budget {max_calls} calls)")
+    return planned
+
+def dispatch_stop_reason(deadline, max_calls, calls_used, in_flight):
+    """Why no further city should be started, or None"""
+    # A city still needs roughly the p95 latency to finish
+    if deadline is not None and time.time() + get_hedge_delay() >= deadline:
+        return 'deadline'
+    # Reserve the worst case for every city in flight so the budget is never exceeded
+    if max_calls is not None and calls_used + (in_flight + 1) * MAX_CALLS_PER_CITY > max_calls:
+        return 'budget'
+    return None
+
+def collect_all_air_quality_data(top_500_cities, max_workers=None, deadline=None, max_calls=None):
+    """Collect air quality data for the cities in order, spreading requests across the key pool
+
+    Stops starting new cities once the deadline (epoch seconds) or max_calls would be passed.
+    Cities in flight stop retrying and waiting at the deadline, and those cut off that way are
+    left out like undispatched ones. Returns the records, the error log and the stop reason.
+    """
     collection_start = datetime.now()
-    air_quality_data = []
     error_log = []
     
-    print(f"Collecting data for 500 cities:")
-    log_step('API Collection Start', f'Beginning collection for {len(top_500_cities)} cities')
+    # Each key paces itself, so throughput scales with the number of keys
+    if max_workers is None:
+        max_workers = 2 * len(key_pool)
     
-    for idx, row in top_500_cities.iterrows():
-        city_name = row['city']
-        country = row['country']
-        lat = row['lat']
-        lon = row['lng']
-        population = row['population']
-        
-        if (idx + 1) % 50 == 0:
-            print(f"{idx + 1}/{len(top_500_cities)}")
-        
-        result = get_current_air_quality(lat, lon, API_KEY)
-        
-        if result['status'] == 'success':
-            api_data = result['data']
-            
-            aqi = None
-            category = None
-            dominant_pollutant = None
-            
-            if 'indexes' in api_data and len(api_data['indexes']) > 0:
-                index_data = api_data['indexes'][0]
-                aqi = index_data.get('aqi', None)
-                category = index_data.get('category', None)
-                dominant_pollutant = index_data.get('dominantPollutant', None)
-            
-            air_quality_data.append({
-                'city': city_name,
-                'country': country,
-                'lat': lat,
-                'lon': lon,
-                'aqi': aqi,
-                'aqi_category': category,
-                'dominant_pollutant': dominant_pollutant,
-                'collection_timestamp': datetime.now().isoformat(),
-                'status': 'success'
-            })
-        else:
-            # Error log
-            error_log.append({
-                'city': city_name,
-                'country': country,
-                'error_type': result.get('error_type', 'unknown'),
-                'timestamp': datetime.now().isoformat()
-            })
+    print(f"Collecting data for {len(top_500_cities)} cities:")
+    log_step('API Collection Start', f'Beginning collection for {len(top_500_cities)} cities '
+             f'with {len(key_pool)} API keys, {max_workers} workers')
+    
+    def collect_city(row):
+        result = get_current_air_quality(row['lat'], row['lng'], deadline=deadline)
+        return build_raw_record(row['city'], row['country'], row['lat'], row['lng'], result)
+    
+    rows = [row for _, row in top_500_cities.iterrows()]
+    results = {}
+    calls_at_start = pool_request_count()
+    stop_reason = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        next_index = 0
+        while True:
+            while stop_reason is None and next_index < len(rows) and len(pending) < max_workers:
+                stop_reason = dispatch_stop_reason(deadline, max_calls, pool_request_count() - calls_at_start, len(pending))
+                if stop_reason is None:
+                    pending[executor.submit(collect_city, rows[next_index])] = next_index
+                    next_index += 1
+            if not pending:
+                break
             
-            air_quality_data.append({
-                'city': city_name,
-                'country': country,
-                'lat': lat,
-                'lon': lon,
-                'aqi': None,
-                'aqi_category': None,
-                'dominant_pollutant': None,
-                'collection_timestamp': datetime.now().isoformat(),
-                'status': 'error'
-            })
-        
-        # Rate limiting
-        time.sleep(0.25)
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                record, error_entry = future.result()
+                if error_entry is not None and error_entry['error_type'] == 'deadline':
+                    # Cut off by the deadline rather than failed, so not held against the city
+                    stop_reason = stop_reason or 'deadline'
+                    continue
+                results[index] = (record, error_entry)
+                if len(results) % 50 == 0:
+                    print(f"{len(results)}/{len(top_500_cities)}")
+    
+    # Completed cities only, in dispatch order, so a partial run is still a consistent raw file
+    air_quality_data = []
+    for i in sorted(results):
+        record, error_entry = results[i]
+        air_quality_data.append(record)
+        if error_entry is not None:
+            error_log.append(error_entry)
     
     collection_end = datetime.now()
     duration = (collection_end - collection_start).total_seconds()
+    calls = pool_request_count() - calls_at_start
     
     print(f"Done! {duration} seconds)")
-    log_step('API Collection Complete', f'Collected {len(air_quality_data)} records in {duration:.1f}s, {len(error_log)} errors')
+    if stop_reason is not None:
+        log_step('API Collection Stopped', f'Reached the {stop_reason}; {len(rows) - len(results)} cities not collected')
+    log_step('API Collection Complete', f'Collected {len(air_quality_data)} records in {duration:.1f}s, '
+             f'{calls} API calls, {len(error_log)} errors')
+    log_step('API Latency', f"{hedge_stats['hedged']} of {hedge_stats['requests']} requests hedged, p95 {get_hedge_delay():.2f}s")
+    key_usage = report_key_usage()
+    save_collection_stats(len(results), duration, calls, int(key_usage['rate_limited'].sum()), max_workers)
     
-    return air_quality_data, error_log
+    return air_quality_data, error_log, stop_reason
+
+def save_collection_stats(num_cities, duration, calls, rate_limited, max_workers, filepath=COLLECTION_STATS_PATH):
+    """Save this run's throughput, latency and rate-limit stats for the next run's estimate"""
+    if num_cities == 0 or calls == 0:
+        return
+    latencies = np.array(request_latencies)
+    stats = {
+        'timestamp': datetime.now().isoformat(),
+        'cities': num_cities,
+        'calls': calls,
+        'seconds': round(duration, 1),
+        'keys': len(key_pool),
+        'workers': max_workers,
+        'calls_per_city': round(calls / num_cities, 3),
+        'seconds_per_city': round(duration / num_cities, 3),
+        'mean_latency': round(float(latencies.mean()), 3) if len(latencies) > 0 else DEFAULT_LATENCY,
+        'p95_latency': round(float(np.percentile(latencies, 95)), 3) if len(latencies) > 0 else DEFAULT_LATENCY,
+        'rate_limited_per_call': round(rate_limited / calls, 4)
+    }
+    with open(filepath, 'w') as f:
+        json.dump(stats, f, indent=2)
+
+def save_coverage_report(plan, air_quality_data, stop_reason, planned):
+    """Per-city coverage of this run: collected, failed, or skipped and why"""
+    coverage = plan[['city', 'country', 'population', 'priority', 'last_success', 'recent_error_rate']].copy()
+    collected = pd.DataFrame(air_quality_data, columns=['city', 'country', 'status'])
+    status = collected.drop_duplicates(subset=['city', 'country']).set_index(['city', 'country'])['status']
+    coverage['status'] = status.reindex(pd.MultiIndex.from_frame(coverage[['city', 'country']])).to_numpy()
+    coverage['status'] = coverage['status'].fillna(f'skipped_{stop_reason}')
+    coverage['within_estimate'] = np.arange(len(coverage)) < planned
+
+    coverage_filename = f"data/collection_coverage_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    coverage.to_csv(coverage_filename, index=False)
+
+    succeeded = coverage['status'] == 'success'
+    population_share = coverage.loc[succeeded, 'population'].sum() / coverage['population'].sum()
+    log_step('Collection Coverage', f'{succeeded.sum()} of {len(coverage)} cities collected '
+             f'({population_share:.1%} of population), report: {coverage_filename}')
+    return coverage
 
 def save_raw_data(air_quality_data, error_log):
     """Save raw API data and error log"""
@@ -218,24 +717,50 @@ def save_raw_data(air_quality_data, error_log):
     
     return raw_aq_df
 
-def main():
+def main(deadline_minutes=None, max_calls=None, dry_run=False):
     """Main execution function"""
     print("=== Full Data Collection Script ===\n")
     
+    # A dry run leaves no trace: no data files and nothing in the curation log
+    log_start = len(curation_log)
+    
     # Part 1: Validate SimpleMaps data
     cities_df = validate_simplemaps_data()
     
     # Part 2: Select top 500
-    top_500_cities = select_top_500_cities(cities_df)
+    top_500_cities = select_top_500_cities(cities_df, save=not dry_run)
+    
+    # Part 3: Plan the run - priority order and call/time estimate
+    plan = prioritize_cities(top_500_cities, load_city_history(top_500_cities))
+    max_workers = 2 * len(key_pool)
+    estimate = estimate_collection(len(plan), load_collection_stats(), max_workers)
+    planned = cities_within_limits(estimate, deadline_minutes, max_calls)
+    print(plan[['city', 'country', 'population', 'staleness_score', 'recent_error_rate', 'priority']].head(10))
     
-    # Part 3: Collect all air quality data
-    air_quality_data, error_log = collect_all_air_quality_data(top_500_cities)
+    if dry_run:
+        print(f"\nDry run: would collect ~{planned} of {len(plan)} cities, "
+              f"~{estimate['calls']} calls in ~{estimate['seconds'] / 60:.1f} min for all")
+        del curation_log[log_start:]
+        return None
     
-    # Part 4: Save raw data
+    # Part 4: Collect air quality data, highest priority first
+    deadline = time.time() + deadline_minutes * 60 if deadline_minutes is not None else None
+    air_quality_data, error_log, stop_reason = collect_all_air_quality_data(plan, max_workers, deadline, max_calls)
+    
+    # Part 5: Save raw data and coverage
     raw_aq_df = save_raw_data(air_quality_data, error_log)
+    save_coverage_report(plan, air_quality_data, stop_reason, planned)
     
     print("\n=== Full Data Collection Complete ===")
     return raw_aq_df
 
+# Fall back to the single configured key when no pool is set up
+init_credential_pool(API_KEYS or [API_KEY])
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Collect air quality data for the top 500 cities')
+    parser.add_argument('--deadline-minutes', type=float, help='stop starting new cities after this many minutes')
+    parser.add_argument('--max-calls', type=int, help='never make more than this many API calls')
+    parser.add_argument('--dry-run', action='store_true', help='print the plan and estimate without calling the API')
+    args = parser.parse_args()
+    main(deadline_minutes=args.deadline_minutes, max_calls=args.max_calls, dry_run=args.dry_run)
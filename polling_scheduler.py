@@ -0,0 +1,222 @@
+"""
+Continuous Polling Scheduler
+Keeps air quality data fresh for the top cities under a fixed API budget by
+refreshing stale, polluted and fast-changing cities more often
+"""
+
+import pandas as pd
+import numpy as np
+import glob
+import heapq
+import time
+from collections import deque
+from datetime import datetime
+from full_collection import (log_step, get_current_air_quality, build_raw_record,
+                             pool_request_count, report_key_usage, MAX_CALLS_PER_CITY)
+from anomaly_detection import update_anomalies
+
+# Refresh intervals (seconds) for a clean, stable city and the fastest allowed
+BASE_INTERVAL = 6 * 3600
+MIN_INTERVAL = 15 * 60
+
+# How strongly severity (AQI level) and volatility (recent AQI std) shorten the interval
+SEVERITY_WEIGHT = 2.0
+VOLATILITY_WEIGHT = 1.0
+
+# Number of recent readings kept per city for the volatility estimate
+HISTORY_LENGTH = 6
+
+def init_city_states(top_cities):
+    """Create the per-city polling state, keyed by (city, country)"""
+    states = {}
+    for order, row in enumerate(top_cities.itertuples(index=False)):
+        states[(row.city, row.country)] = {
+            'order': order,
+            'lat': row.lat,
+            'lon': row.lng,
+            'last_polled': None,
+            'last_record': None,
+            'aqi_history': deque(maxlen=HISTORY_LENGTH),
+            'consecutive_errors': 0
+        }
+    log_step('Scheduler Init', f'Tracking {len(states)} cities')
+    return states
+
+def seed_from_raw_snapshots(states, pattern='data/raw_air_quality_*.csv'):
+    """Warm start the city states from previously collected raw files"""
+    # File names carry the collection timestamp, so name order is collection order
+    raw_files = sorted(glob.glob(pattern))
+    if not raw_files:
+        return states
+
+    history = pd.concat([pd.read_csv(f) for f in raw_files], ignore_index=True)
+    history = history[history['status'] == 'success']
+    history['collection_timestamp'] = pd.to_datetime(history['collection_timestamp'], format='ISO8601', errors='coerce')
+    history = history.dropna(subset=['collection_timestamp']).sort_values('collection_timestamp')
+
+    seeded = 0
+    for (city, country), group in history.groupby(['city', 'country']):
+        state = states.get((city, country))
+        if state is None:
+            continue
+        state['aqi_history'].extend(group['aqi'].dropna().tail(HISTORY_LENGTH).tolist())
+        # Timestamps are naive local time; Timestamp.timestamp() would read them as UTC,
+        # while datetime.timestamp() reads them as local time like time.time()
+        state['last_polled'] = group['collection_timestamp'].iloc[-1].to_pydatetime().timestamp()
+        state['last_record'] = group.iloc[-1].to_dict()
+        state['last_record']['collection_timestamp'] = group['collection_timestamp'].iloc[-1].isoformat()
+        seeded += 1
+
+    log_step('Scheduler Seed', f'Seeded {seeded} cities from {len(raw_files)} raw files')
+    return states
+
+def compute_refresh_interval(state):
+    """Seconds until a city should be polled again, shorter for severe or volatile cities"""
+    history = state['aqi_history']
+
+    # Higher UAQI means cleaner air, so severity rises as AQI falls;
+    # unknown cities count as moderately severe so they are not starved
+    severity = (100 - min(history[-1], 100)) / 100 if history else 0.5
+    volatility = min(np.std(history) / 10, 1.0) if len(history) >= 2 else 0.0
+
+    weight = 1 + SEVERITY_WEIGHT * severity + VOLATILITY_WEIGHT * volatility
+    interval = BASE_INTERVAL / weight
+
+    # Back off on cities that keep failing
+    if state['consecutive_errors'] > 0:
+        interval *= 2 ** min(state['consecutive_errors'], 3)
+
+    return float(np.clip(interval, MIN_INTERVAL, 4 * BASE_INTERVAL))
+
+def build_priority_queue(states):
+    """Heap of (due_time, order, key); never-polled cities are due immediately in population order"""
+    queue = []
+    for key, state in states.items():
+        if state['last_polled'] is None:
+            due = 0.0
+        else:
+            due = state['last_polled'] + compute_refresh_interval(state)
+        queue.append((due, state['order'], key))
+    heapq.heapify(queue)
+    return queue
+
+def poll_city(key, state, error_log):
+    """Poll one city and update its state, returning the raw record"""
+    city_name, country = key
+    result = get_current_air_quality(state['lat'], state['lon'])
+    record, error_entry = build_raw_record(city_name, country, state['lat'], state['lon'], result)
+
+    state['last_polled'] = time.time()
+    if error_entry is None:
+        state['consecutive_errors'] = 0
+        state['last_record'] = record
+        if record['aqi'] is not None:
+            state['aqi_history'].append(record['aqi'])
+    else:
+        state['consecutive_errors'] += 1
+        error_log.append(error_entry)
+        # Keep the last good reading in the snapshot rather than overwrite it with a blank
+        if state['last_record'] is None:
+            state['last_record'] = record
+
+    return record
+
+def write_snapshot(states, error_log):
+    """Write the latest record per city as a raw air quality file"""
+    records = [s['last_record'] for s in states.values() if s['last_record'] is not None]
+    if not records:
+        return None
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    raw_filename = f"data/raw_air_quality_{timestamp}.csv"
+    pd.DataFrame(records).to_csv(raw_filename, index=False)
+    log_step('Scheduler Snapshot', f'Saved {len(records)} city records: {raw_filename}')
+    update_anomalies(raw_filename)
+
+    if len(error_log) > 0:
+        error_filename = f"data/collection_errors_{timestamp}.csv"
+        pd.DataFrame(error_log).to_csv(error_filename, index=False)
+        log_step('Error Logging', f'Saved {len(error_log)} errors to {error_filename}')
+        error_log.clear()
+
+    return raw_filename
+
+def run_scheduler(states, calls_per_hour=1000, max_runtime=None, snapshot_interval=3600):
+    """Poll cities in due-time order, keeping real API calls within calls_per_hour
+
+    One poll can make up to MAX_CALLS_PER_CITY requests (retries and hedges), so polls are
+    spaced by the calls they actually used, and a poll only starts if its worst case still
+    fits in the trailing hour.
+    """
+    call_spacing = 3600 / calls_per_hour
+    queue = build_priority_queue(states)
+    error_log = []
+    recent_calls = deque()  # (time, API calls) per poll in the trailing hour
+
+    start = time.time()
+    next_call = start
+    next_snapshot = start + snapshot_interval
+    calls = 0
+    polls = 0
+
+    log_step('Scheduler Start', f'Budget {calls_per_hour} calls/hour, {len(queue)} cities queued')
+
+    try:
+        while queue:
+            now = time.time()
+            if max_runtime is not None and now - start >= max_runtime:
+                break
+
+            if now >= next_snapshot:
+                write_snapshot(states, error_log)
+                next_snapshot = now + snapshot_interval
+
+            while recent_calls and recent_calls[0][0] <= now - 3600:
+                recent_calls.popleft()
+            next_allowed = next_call
+            if sum(c for _, c in recent_calls) + MAX_CALLS_PER_CITY > calls_per_hour and recent_calls:
+                next_allowed = max(next_allowed, recent_calls[0][0] + 3600)
+
+            due, order, key = queue[0]
+            wait = max(due, next_allowed) - now
+            if wait > 0:
+                # Sleep in short steps so snapshots and max_runtime are still honoured
+                time.sleep(min(wait, 60))
+                continue
+
+            heapq.heappop(queue)
+            state = states[key]
+            calls_before = pool_request_count()
+            poll_city(key, state, error_log)
+            used = pool_request_count() - calls_before
+            recent_calls.append((time.time(), used))
+            calls += used
+            polls += 1
+            next_call = time.time() + call_spacing * max(used, 1)
+
+            heapq.heappush(queue, (state['last_polled'] + compute_refresh_interval(state), order, key))
+
+            if polls % 50 == 0:
+                print(f"{polls} cities polled ({calls} API calls), last polled: {key[0]}")
+    except KeyboardInterrupt:
+        print("Stopping scheduler")
+
+    write_snapshot(states, error_log)
+    duration = time.time() - start
+    log_step('Scheduler Stop', f'Made {calls} API calls for {polls} polls in {duration:.1f}s')
+    report_key_usage()
+    return states
+
+def main(calls_per_hour=1000, max_runtime=None):
+    """Main execution function"""
+    print("=== Continuous Polling Scheduler ===\n")
+
+    top_cities = pd.read_csv('data/top_500_cities.csv')
+    states = init_city_states(top_cities)
+    states = seed_from_raw_snapshots(states)
+    run_scheduler(states, calls_per_hour=calls_per_hour, max_runtime=max_runtime)
+
+    print("\n=== Polling Scheduler Stopped ===")
+
+if __name__ == "__main__":
+    main()
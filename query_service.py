@@ -0,0 +1,217 @@
+"""
+Local Query Service
+Serves fast lookups over the integrated dataset from in-memory indexes,
+reloading automatically when a new final CSV is written
+"""
+
+import pandas as pd
+import numpy as np
+import json
+import os
+import threading
+from functools import lru_cache, partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+from scipy.spatial import cKDTree
+from spatial_interpolation import to_unit_vectors, chord_to_km
+
+FINAL_DATASET = 'data/integrated_cities_air_quality_final.csv'
+
+# Fields with a sorted index that /range and /top may use
+SORTABLE_FIELDS = ('aqi', 'population')
+
+# Loaded indexes and the mtime of the file they were built from
+service_state = {'index': None, 'mtime': None}
+reload_lock = threading.Lock()
+
+def build_sorted_index(values):
+    """Positions sorted by value (missing values dropped) plus the sorted values for searchsorted"""
+    valid = np.flatnonzero(~np.isnan(values))
+    order = valid[np.argsort(values[valid], kind='stable')]
+    return {'positions': order, 'values': values[order]}
+
+def build_indexes(filepath=FINAL_DATASET):
+    """Load the final dataset once and build hash, sorted and spatial indexes"""
+    df = pd.read_csv(filepath)
+    records = json.loads(df.to_json(orient='records'))
+
+    by_country = {}
+    by_iso3 = {}
+    for pos, (country, iso3) in enumerate(zip(df['country'], df['iso3'])):
+        by_country.setdefault(str(country).lower(), []).append(pos)
+        by_iso3.setdefault(str(iso3).upper(), []).append(pos)
+
+    latitude = df['latitude'].to_numpy(dtype=float)
+    longitude = df['longitude'].to_numpy(dtype=float)
+    has_coords = np.flatnonzero(~np.isnan(latitude) & ~np.isnan(longitude))
+
+    index = {
+        'records': records,
+        'by_country': by_country,
+        'by_iso3': by_iso3,
+        'aqi': build_sorted_index(df['aqi'].to_numpy(dtype=float)),
+        'population': build_sorted_index(df['population'].to_numpy(dtype=float)),
+        'latitude': build_sorted_index(latitude),
+        'longitude': longitude,
+        'tree_positions': has_coords,
+        'tree': cKDTree(to_unit_vectors(latitude[has_coords], longitude[has_coords]))
+    }
+    # Each index gets its own result cache, so a query that started before a reload
+    # can only ever cache into the old index's cache, never the new one
+    index['run_query'] = lru_cache(maxsize=1024)(partial(run_query, index))
+    print(f"Indexed {len(records)} cities from {filepath}")
+    return index
+
+def refresh_if_changed(filepath=FINAL_DATASET):
+    """Rebuild the indexes if the final dataset has been rewritten since the last load"""
+    mtime = os.path.getmtime(filepath)
+    if mtime == service_state['mtime']:
+        return service_state['index']
+
+    with reload_lock:
+        if mtime != service_state['mtime']:
+            service_state['index'] = build_indexes(filepath)
+            service_state['mtime'] = mtime
+    return service_state['index']
+
+def range_positions(sorted_index, low=None, high=None):
+    """Positions whose value falls in [low, high]"""
+    values = sorted_index['values']
+    start = 0 if low is None else np.searchsorted(values, low, side='left')
+    stop = len(values) if high is None else np.searchsorted(values, high, side='right')
+    return sorted_index['positions'][start:stop]
+
+def sort_field(params):
+    """The field to range/sort on, limited to the sorted indexes"""
+    field = params.get('field', 'aqi')
+    if field not in SORTABLE_FIELDS:
+        raise ValueError(f"field must be one of {', '.join(SORTABLE_FIELDS)}")
+    return field
+
+def positive_int(params, name, default):
+    """An integer query parameter that must be at least 1"""
+    value = int(params.get(name, default))
+    if value < 1:
+        raise ValueError(f'{name} must be at least 1')
+    return value
+
+def query_country(index, params):
+    """/country?name=Japan or /country?iso3=JPN"""
+    if 'iso3' in params:
+        return index['by_iso3'].get(params['iso3'].upper(), [])
+    return index['by_country'].get(params.get('name', '').lower(), [])
+
+def query_range(index, params):
+    """/range?field=aqi&min=50&max=80&limit=20 (field: aqi or population)"""
+    field = sort_field(params)
+    low = float(params['min']) if 'min' in params else None
+    high = float(params['max']) if 'max' in params else None
+    positions = range_positions(index[field], low, high)
+    return positions[:positive_int(params, 'limit', max(len(positions), 1))]
+
+def query_top(index, params):
+    """/top?field=population&k=10&order=desc"""
+    field = sort_field(params)
+    k = positive_int(params, 'k', 10)
+    positions = index[field]['positions']
+    if params.get('order', 'desc') == 'desc':
+        return positions[::-1][:k]
+    return positions[:k]
+
+def query_bbox(index, params):
+    """/bbox?min_lat=..&max_lat=..&min_lon=..&max_lon=.."""
+    min_lat, max_lat = float(params['min_lat']), float(params['max_lat'])
+    min_lon, max_lon = float(params['min_lon']), float(params['max_lon'])
+
+    # Narrow by latitude through the sorted index, then filter longitude
+    positions = range_positions(index['latitude'], min_lat, max_lat)
+    lon = index['longitude'][positions]
+    if min_lon <= max_lon:
+        inside = (lon >= min_lon) & (lon <= max_lon)
+    else:
+        # Box crosses the antimeridian
+        inside = (lon >= min_lon) | (lon <= max_lon)
+    return positions[inside]
+
+def query_nearest(index, params):
+    """/nearest?lat=..&lon=..&k=5, with great-circle distance_km"""
+    k = min(positive_int(params, 'k', 5), len(index['tree_positions']))
+    point = to_unit_vectors(float(params['lat']), float(params['lon']))[0]
+    chord, idx = index['tree'].query(point, k=k)
+    chord, idx = np.atleast_1d(chord), np.atleast_1d(idx)
+
+    results = []
+    for c, i in zip(chord, idx):
+        record = dict(index['records'][index['tree_positions'][i]])
+        record['distance_km'] = round(float(chord_to_km(c)), 3)
+        results.append(record)
+    return results
+
+QUERY_HANDLERS = {
+    '/country': query_country,
+    '/range': query_range,
+    '/top': query_top,
+    '/bbox': query_bbox,
+    '/nearest': query_nearest
+}
+
+def run_query(index, path, query_items):
+    """Run a query and return the JSON body (cached per index through index['run_query'])"""
+    result = QUERY_HANDLERS[path](index, dict(query_items))
+    if len(result) == 0 or not isinstance(result[0], dict):
+        result = [index['records'][pos] for pos in result]
+    return json.dumps({'count': len(result), 'results': result})
+
+class QueryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path not in QUERY_HANDLERS:
+            self.send_json(404, json.dumps({'error': f'Unknown endpoint {parsed.path}',
+                                            'endpoints': sorted(QUERY_HANDLERS)}))
+            return
+
+        try:
+            index = refresh_if_changed()
+        except Exception as e:
+            # The dataset is unreadable right now; the previous index stays loaded for the next try
+            self.send_json(503, json.dumps({'error': f'Dataset unavailable: {e}'}))
+            return
+
+        query_items = tuple(sorted(parse_qsl(parsed.query)))
+        try:
+            body = index['run_query'](parsed.path, query_items)
+        except (KeyError, ValueError) as e:
+            self.send_json(400, json.dumps({'error': f'Bad query: {e}'}))
+            return
+        except Exception as e:
+            # Always answer rather than drop the connection
+            self.send_json(500, json.dumps({'error': f'Query failed: {e}'}))
+            return
+        self.send_json(200, body)
+
+    def send_json(self, status, body):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def main(host='127.0.0.1', port=8765):
+    """Main execution function"""
+    print("=== Local Query Service ===\n")
+
+    refresh_if_changed()
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    print(f"Serving on http://{host}:{port} ({', '.join(sorted(QUERY_HANDLERS))})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping query service")
+    server.server_close()
+
+if __name__ == "__main__":
+    main()
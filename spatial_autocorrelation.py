@@ -0,0 +1,191 @@
+"""
+Spatial Autocorrelation Script
+Tests whether AQI clusters geographically (global Moran's I) and finds local
+clean-air and pollution clusters (Getis-Ord Gi*) using sparse neighbor weights
+"""
+
+import pandas as pd
+import numpy as np
+import os
+from scipy import sparse
+from scipy.spatial import cKDTree
+from scipy.stats import norm
+from full_collection import log_step
+from spatial_interpolation import to_unit_vectors, km_to_chord
+
+def load_points(final_path='data/integrated_cities_air_quality_final.csv',
+                estimates_path='data/estimated_cities_air_quality.csv', include_estimates=False):
+    """Load cities with AQI and coordinates, optionally adding interpolated gazetteer cities"""
+    df = pd.read_csv(final_path)
+    df = df[df['aqi'].notna() & df['latitude'].notna() & df['longitude'].notna()]
+    points = df[['city', 'country', 'latitude', 'longitude', 'aqi']].assign(source='measured')
+
+    if include_estimates and os.path.exists(estimates_path):
+        estimates = pd.read_csv(estimates_path)
+        estimates = estimates[estimates['estimated_aqi'].notna()].rename(columns={'estimated_aqi': 'aqi'})
+        points = pd.concat([points, estimates[['city', 'country', 'latitude', 'longitude', 'aqi']].assign(source='estimated')])
+
+    points = points.reset_index(drop=True)
+    log_step('Spatial Weights Input', f'{len(points)} cities with AQI and coordinates')
+    return points
+
+def build_knn_weights(points, k=8):
+    """Sparse binary k-nearest-neighbor weights (no self-links)"""
+    xyz = to_unit_vectors(points['latitude'].to_numpy(), points['longitude'].to_numpy())
+    n = len(xyz)
+    k = min(k, n - 1)
+
+    # Ask for k + 1 because each point's nearest neighbor is itself
+    _, idx = cKDTree(xyz).query(xyz, k=k + 1)
+    rows = np.repeat(np.arange(n), k)
+    cols = idx[:, 1:].ravel()
+    weights = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+    log_step('Spatial Weights', f'{k}-nearest-neighbor weights, {weights.nnz} links')
+    return weights
+
+def build_distance_band_weights(points, threshold_km=500):
+    """Sparse binary weights linking every pair of cities within threshold_km"""
+    xyz = to_unit_vectors(points['latitude'].to_numpy(), points['longitude'].to_numpy())
+    tree = cKDTree(xyz)
+    pairs = tree.sparse_distance_matrix(tree, km_to_chord(threshold_km), output_type='coo_matrix').tocsr()
+    pairs.setdiag(0)
+    pairs.eliminate_zeros()
+    weights = (pairs > 0).astype(float)
+
+    islands = int((weights.getnnz(axis=1) == 0).sum())
+    log_step('Spatial Weights', f'{threshold_km} km distance band, {weights.nnz} links, {islands} cities without neighbors')
+    return weights
+
+def row_standardize(weights):
+    """Scale each row to sum to 1 (rows without neighbors stay zero)"""
+    row_sums = np.asarray(weights.sum(axis=1)).ravel()
+    scale = np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums > 0)
+    return sparse.diags(scale) @ weights
+
+def permutation_batches(x, permutations, rng, max_batch_bytes=64 * 2**20):
+    """Yield (n, batch) matrices of randomly permuted x, sized to stay under max_batch_bytes"""
+    n = len(x)
+    batch_size = max(1, min(permutations, max_batch_bytes // (8 * n)))
+    done = 0
+    while done < permutations:
+        b = min(batch_size, permutations - done)
+        batch = np.repeat(x[:, None], b, axis=1)
+        yield rng.permuted(batch, axis=0, out=batch)
+        done += b
+
+def conditional_neighbor_sums(x, cardinality, permutations, rng, max_batch_bytes=64 * 2**20):
+    """Yield (n, batch) sums of cardinality[i] values drawn from x without x_i (conditional permutation)
+
+    As in PySAL's conditional randomization, each permutation draws one random order of
+    n - 1 positions shared by all cities; city i takes the first cardinality[i] of them,
+    shifted past its own position so x_i is never its own neighbor.
+    """
+    n = len(x)
+    max_k = max(int(cardinality.max()), 1)
+    take = np.arange(max_k)[None, :] < cardinality[:, None]
+    own = np.arange(n)[:, None, None]
+    batch_size = max(1, min(permutations, max_batch_bytes // (8 * n * max_k)))
+    done = 0
+    while done < permutations:
+        b = min(batch_size, permutations - done)
+        draws = rng.random((b, n - 1)).argsort(axis=1)[:, :max_k]
+        idx = draws[None, :, :] + (draws[None, :, :] >= own)
+        yield (x[idx] * take[:, None, :]).sum(axis=2)
+        done += b
+
+def spatial_autocorrelation(points, weights, permutations=999, seed=42):
+    """Global Moran's I and local Getis-Ord Gi* with batched permutation inference"""
+    rng = np.random.default_rng(seed)
+    x = points['aqi'].to_numpy(dtype=float)
+    n = len(x)
+
+    # Global Moran's I on row-standardized weights
+    w_row = row_standardize(weights)
+    z = x - x.mean()
+    z_ss = z @ z
+    moran_i = (z @ (w_row @ z)) / z_ss * n / w_row.sum()
+
+    # Gi* includes each city in its own neighborhood; binary weights so S1 = W_i
+    w_i = np.asarray(weights.sum(axis=1)).ravel() + 1
+    local_sum = weights @ x + x
+    x_mean = x.mean()
+    s = np.sqrt((x ** 2).mean() - x_mean ** 2)
+    denom = s * np.sqrt((n * w_i - w_i ** 2) / (n - 1))
+    gi_z = np.divide(local_sum - x_mean * w_i, denom, out=np.zeros(n), where=denom > 0)
+
+    # Global Moran's I: full random permutations of the whole vector
+    moran_perm = []
+    for x_perm in permutation_batches(x, permutations, rng):
+        z_perm = x_perm - x_mean
+        moran_perm.append((z_perm * (w_row @ z_perm)).sum(axis=0) / z_ss * n / w_row.sum())
+    moran_perm = np.concatenate(moran_perm)
+
+    # Gi*: each city keeps its own value and draws its neighbors from the other n - 1
+    cardinality = weights.getnnz(axis=1)
+    neighbor_sum = weights @ x
+    gi_larger = np.zeros(n)
+    for perm_sum in conditional_neighbor_sums(x, cardinality, permutations, rng):
+        gi_larger += (perm_sum >= neighbor_sum[:, None]).sum(axis=1)
+
+    larger = (moran_perm >= moran_i).sum()
+    global_stats = pd.DataFrame([{
+        'n': n,
+        'links': weights.nnz,
+        'moran_i': moran_i,
+        'expected_i': -1 / (n - 1),
+        'perm_mean': moran_perm.mean(),
+        'perm_std': moran_perm.std(),
+        'z_sim': (moran_i - moran_perm.mean()) / moran_perm.std(),
+        'p_sim': (min(larger, permutations - larger) + 1) / (permutations + 1),
+        'permutations': permutations
+    }])
+
+    gi_p_sim = (np.minimum(gi_larger, permutations - gi_larger) + 1) / (permutations + 1)
+    # A city without neighbors has a constant permuted sum, so no inference is possible
+    islands = cardinality == 0
+    gi_z[islands] = np.nan
+    gi_p_sim[islands] = np.nan
+    hotspots = points.copy()
+    hotspots['gi_star_z'] = gi_z
+    hotspots['gi_star_p_norm'] = 2 * norm.sf(np.abs(gi_z))
+    hotspots['gi_star_p_sim'] = gi_p_sim
+    hotspots['hotspot_class'] = classify_hotspots(gi_z, gi_p_sim, islands)
+
+    significant = ~hotspots['hotspot_class'].isin(['Not significant', 'No neighbors'])
+    log_step('Spatial Autocorrelation', f"Moran's I = {moran_i:.4f} (p_sim = {global_stats['p_sim'].iloc[0]:.4f}), "
+             f"{significant.sum()} significant clusters, {islands.sum()} cities without neighbors")
+    return global_stats, hotspots
+
+def classify_hotspots(gi_z, p_sim, islands):
+    """Label clusters at 99/95/90% confidence; high UAQI is clean air, so a high cluster is clean"""
+    labels = np.full(len(gi_z), 'Not significant', dtype=object)
+    for level, alpha in [('90%', 0.10), ('95%', 0.05), ('99%', 0.01)]:
+        significant = p_sim <= alpha
+        labels[significant & (gi_z > 0)] = f'Clean-air cluster {level}'
+        labels[significant & (gi_z < 0)] = f'Pollution cluster {level}'
+    labels[islands] = 'No neighbors'
+    return labels
+
+def save_spatial_results(global_stats, hotspots, output_dir='data'):
+    """Save global and local spatial statistics"""
+    global_stats.to_csv(f'{output_dir}/spatial_autocorrelation.csv', index=False)
+    hotspots.to_csv(f'{output_dir}/aqi_hotspots.csv', index=False)
+    print(f"Saved: {output_dir}/spatial_autocorrelation.csv, {output_dir}/aqi_hotspots.csv")
+
+def main(include_estimates=False):
+    """Main execution function"""
+    print("=== Spatial Autocorrelation Script ===\n")
+
+    points = load_points(include_estimates=include_estimates)
+    weights = build_knn_weights(points)
+    global_stats, hotspots = spatial_autocorrelation(points, weights)
+
+    print(global_stats.T)
+    print(hotspots['hotspot_class'].value_counts())
+    print(hotspots.sort_values('gi_star_z', ascending=False)[['city', 'country', 'aqi', 'gi_star_z', 'hotspot_class']].head(10))
+    save_spatial_results(global_stats, hotspots)
+
+    print("\n=== Spatial Autocorrelation Complete ===")
+
+if __name__ == "__main__":
+    main()
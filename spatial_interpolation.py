@@ -0,0 +1,132 @@
+"""
+Spatial Interpolation Script
+Estimates AQI for every unmeasured city in the SimpleMaps gazetteer from the
+nearest measured cities using inverse-distance weighting
+"""
+
+import pandas as pd
+import numpy as np
+from scipy.spatial import cKDTree
+from full_collection import log_step
+
+EARTH_RADIUS_KM = 6371.0
+
+def to_unit_vectors(lat, lon):
+    """Convert lat/lon in degrees to 3D unit vectors for chord-distance KD-tree lookups"""
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def chord_to_km(chord):
+    """Convert unit-sphere chord length to great-circle (haversine) distance in km"""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+
+def km_to_chord(km):
+    """Convert great-circle distance in km to unit-sphere chord length"""
+    return 2 * np.sin(np.minimum(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+def load_interpolation_inputs(cities_path='data/worldcities.csv',
+                              final_path='data/integrated_cities_air_quality_final.csv'):
+    """Load measured cities and the unmeasured gazetteer cities to estimate"""
+    final_data = pd.read_csv(final_path)
+    measured = final_data[
+        final_data['aqi'].notna() &
+        final_data['latitude'].notna() &
+        final_data['longitude'].notna()
+    ].reset_index(drop=True)
+
+    cities_df = pd.read_csv(cities_path).rename(columns={'lat': 'latitude', 'lng': 'longitude'})
+    cities_df['city'] = cities_df['city'].str.strip()
+    cities_df['country'] = cities_df['country'].str.strip()
+    valid = cities_df['latitude'].between(-90, 90) & cities_df['longitude'].between(-180, 180)
+
+    # Anything already in the final dataset is measured (or was attempted) and is not re-estimated
+    measured_keys = pd.MultiIndex.from_frame(final_data[['city', 'country']])
+    target_keys = pd.MultiIndex.from_frame(cities_df[['city', 'country']])
+    targets = cities_df[valid & ~target_keys.isin(measured_keys)].reset_index(drop=True)
+
+    log_step('Interpolation Inputs', f'{len(measured)} measured cities, {len(targets)} cities to estimate')
+    return measured, targets
+
+def interpolate_aqi(measured, targets, k=8, power=2, max_distance_km=1000, chunk_size=50000):
+    """Vectorized k-nearest-neighbor IDW estimate of AQI for each target city"""
+    k = min(k, len(measured))
+    tree = cKDTree(to_unit_vectors(measured['latitude'].to_numpy(), measured['longitude'].to_numpy()))
+    measured_aqi = np.append(measured['aqi'].to_numpy(dtype=float), np.nan)  # sentinel for missing neighbors
+    max_chord = km_to_chord(max_distance_km)
+
+    target_xyz = to_unit_vectors(targets['latitude'].to_numpy(), targets['longitude'].to_numpy())
+    n = len(targets)
+    estimated_aqi = np.full(n, np.nan)
+    nearest_km = np.full(n, np.nan)
+    mean_km = np.full(n, np.nan)
+    neighbor_std = np.full(n, np.nan)
+    neighbors_used = np.zeros(n, dtype=int)
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        chord, idx = tree.query(target_xyz[start:stop], k=k, distance_upper_bound=max_chord)
+        chord = chord.reshape(stop - start, k)
+        idx = idx.reshape(stop - start, k)
+
+        # Neighbors beyond max_distance_km come back as inf / index len(measured)
+        found = np.isfinite(chord)
+        dist_km = np.where(found, chord_to_km(np.where(found, chord, 0)), np.nan)
+        values = measured_aqi[idx]
+
+        # Clamp distances so co-located cities do not divide by zero
+        weights = np.where(found, 1.0 / np.maximum(dist_km, 1e-3) ** power, 0.0)
+        weight_sum = weights.sum(axis=1)
+        has_neighbors = weight_sum > 0
+
+        count = np.maximum(found.sum(axis=1), 1)
+        found_values = np.where(found, values, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            estimate = (weights * found_values).sum(axis=1) / weight_sum
+        chunk_mean_km = np.where(found, dist_km, 0.0).sum(axis=1) / count
+        value_mean = found_values.sum(axis=1) / count
+        chunk_std = np.sqrt((np.where(found, values - value_mean[:, None], 0.0) ** 2).sum(axis=1) / count)
+
+        estimated_aqi[start:stop] = np.where(has_neighbors, estimate, np.nan)
+        nearest_km[start:stop] = np.where(has_neighbors, dist_km[:, 0], np.nan)
+        mean_km[start:stop] = np.where(has_neighbors, chunk_mean_km, np.nan)
+        neighbor_std[start:stop] = np.where(has_neighbors, chunk_std, np.nan)
+        neighbors_used[start:stop] = found.sum(axis=1)
+
+    # Confidence decays with distance to the measured cities and with disagreement between them
+    distance_term = np.exp(-mean_km / (max_distance_km / 3))
+    agreement_term = 1 / (1 + np.nan_to_num(neighbor_std) / 10)
+    confidence = np.where(neighbors_used > 0, distance_term * agreement_term * neighbors_used / k, 0.0)
+
+    estimates = targets[['city', 'country', 'iso2', 'iso3', 'latitude', 'longitude', 'population']].copy()
+    estimates['estimated_aqi'] = np.round(estimated_aqi, 1)
+    estimates['nearest_measured_km'] = np.round(nearest_km, 1)
+    estimates['mean_neighbor_km'] = np.round(mean_km, 1)
+    estimates['neighbor_aqi_std'] = np.round(neighbor_std, 2)
+    estimates['neighbors_used'] = neighbors_used
+    estimates['estimation_confidence'] = np.round(confidence, 3)
+
+    covered = np.isfinite(estimated_aqi).sum()
+    log_step('Interpolation', f'Estimated AQI for {covered} of {n} cities (k={k}, power={power}, max {max_distance_km} km)')
+    return estimates
+
+def save_estimates(estimates, filepath='data/estimated_cities_air_quality.csv'):
+    """Save interpolated AQI estimates"""
+    estimates.to_csv(filepath, index=False)
+    print(f"Saved: {filepath}")
+    log_step('Interpolation Output', f'Saved {len(estimates)} estimated cities: {filepath}')
+
+def main():
+    """Main execution function"""
+    print("=== Spatial Interpolation Script ===\n")
+
+    measured, targets = load_interpolation_inputs()
+    estimates = interpolate_aqi(measured, targets)
+    print(estimates['estimated_aqi'].describe())
+    save_estimates(estimates)
+
+    print("\n=== Spatial Interpolation Complete ===")
+    return estimates
+
+if __name__ == "__main__":
+    main()
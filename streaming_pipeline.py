@@ -0,0 +1,194 @@
+"""
+Streaming Collection and Integration Script
+Streams each API record through cleaning, quality flagging and the city join,
+appending integrated rows in batches while collection is still running
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from full_collection import log_step, get_current_air_quality, build_raw_record, report_key_usage, key_pool
+from aggregation_cube import update_cube
+from clean_and_integrate import (standardize_column_names, standardize_data_types,
+                                 export_curation_log, FINAL_COLUMN_ORDER)
+
+RAW_COLUMNS = ['city', 'country', 'lat', 'lon', 'aqi', 'aqi_category',
+               'dominant_pollutant', 'collection_timestamp', 'status']
+
+def load_city_lookup(filepath='data/raw_top_500_cities.csv'):
+    """Clean the city table once and index it by (city, country) for per-record joins"""
+    cities = pd.read_csv(filepath)
+    # Same cleaning rules as the batch path; the AQ side is empty here
+    cities_clean, aq_empty = standardize_column_names(cities, pd.DataFrame(columns=RAW_COLUMNS))
+    cities_clean, _ = standardize_data_types(cities_clean, aq_empty)
+
+    # validate_integrated_data keeps the first of any duplicate city-country pair
+    cities_clean = cities_clean.drop_duplicates(subset=['city', 'country'], keep='first')
+    lookup = cities_clean.set_index(['city', 'country'])[['latitude', 'longitude', 'population', 'iso2', 'iso3']]
+    lookup = lookup.to_dict('index')
+
+    log_step('Streaming - City Lookup', f'Loaded {len(lookup)} cities for streaming joins')
+    return cities, lookup
+
+def collect_city(row):
+    """Collect one city, returning its raw record and error entry"""
+    result = get_current_air_quality(row.lat, row.lng)
+    return build_raw_record(row.city, row.country, row.lat, row.lng, result)
+
+def stream_air_quality(top_cities, error_log, max_workers=None):
+    """Yield one raw API record per city, in city order, with up to max_workers cities in flight
+
+    Pacing comes from the key pool; like the batch collector, the default is 2 workers per key.
+    Only the in-flight window is ever held, so memory stays bounded.
+    """
+    if max_workers is None:
+        max_workers = max(2 * len(key_pool), 1)
+
+    rows = top_cities.itertuples(index=False)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        window = deque(executor.submit(collect_city, row) for _, row in zip(range(max_workers), rows))
+        done = 0
+        while window:
+            record, error_entry = window.popleft().result()
+            # Keep the window full while the caller handles this record
+            row = next(rows, None)
+            if row is not None:
+                window.append(executor.submit(collect_city, row))
+
+            if error_entry is not None:
+                error_log.append(error_entry)
+            yield record
+
+            done += 1
+            if done % 50 == 0:
+                print(f"{done}/{len(top_cities)}")
+
+def to_float(value):
+    """Coerce a value to float, using NaN for anything non-numeric (like pd.to_numeric errors='coerce')"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def standardize_records(records):
+    """Per-record equivalent of standardize_column_names + standardize_data_types"""
+    for record in records:
+        yield {
+            'city': str(record['city']).strip(),
+            'country': str(record['country']).strip(),
+            'latitude': to_float(record['lat']),
+            'longitude': to_float(record['lon']),
+            'aqi': to_float(record['aqi']),
+            'aqi_category': record['aqi_category'],
+            'dominant_pollutant': record['dominant_pollutant'],
+            'collection_timestamp': record['collection_timestamp']
+        }
+
+def flag_records(records):
+    """Per-record equivalent of handle_missing_values"""
+    for record in records:
+        record['data_quality_flag'] = 'missing_aqi' if np.isnan(record['aqi']) else 'complete'
+        yield record
+
+def join_records(records, city_lookup, stats):
+    """Join each record to its city, dropping unknown cities and repeated city-country pairs"""
+    seen = set()
+    for record in records:
+        key = (record['city'], record['country'])
+        city = city_lookup.get(key)
+        if city is None:
+            stats['unmatched'] += 1
+            continue
+        if key in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(key)
+
+        # Coordinates and population come from the city table, as in integrate_datasets
+        joined = dict(record)
+        joined.update(city)
+        yield {col: joined[col] for col in FINAL_COLUMN_ORDER}
+
+def batched(items, batch_size):
+    """Group an iterator into lists of at most batch_size"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def append_csv(rows, filepath, columns):
+    """Append rows to a CSV, writing the header only when the file is new"""
+    write_header = not os.path.exists(filepath)
+    pd.DataFrame(rows, columns=columns).to_csv(filepath, mode='a', header=write_header, index=False)
+
+def run_streaming_pipeline(top_cities, city_lookup, batch_size=50, max_workers=None,
+                           final_filename='data/integrated_cities_air_quality_final.csv'):
+    """Collect, clean and integrate city by city, appending integrated rows every batch_size records"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    raw_filename = f"data/raw_air_quality_{timestamp}.csv"
+    stream_filename = f"data/integrated_cities_air_quality_stream_{timestamp}.csv"
+    error_log = []
+    stats = {'unmatched': 0, 'duplicates': 0}
+    raw_buffer = []
+
+    log_step('Streaming Start', f'Streaming {len(top_cities)} cities in batches of {batch_size} to {stream_filename}')
+    start = time.time()
+
+    def keep_raw(records):
+        # Raw records are still saved for provenance, in the same batches
+        for record in records:
+            raw_buffer.append(record)
+            yield record
+
+    records = keep_raw(stream_air_quality(top_cities, error_log, max_workers))
+    integrated = join_records(flag_records(standardize_records(records)), city_lookup, stats)
+
+    rows_written = 0
+    for batch in batched(integrated, batch_size):
+        append_csv(batch, stream_filename, FINAL_COLUMN_ORDER)
+        append_csv(raw_buffer, raw_filename, RAW_COLUMNS)
+        raw_buffer.clear()
+        rows_written += len(batch)
+        print(f"Appended {rows_written} integrated rows")
+    if raw_buffer:
+        append_csv(raw_buffer, raw_filename, RAW_COLUMNS)
+
+    if len(error_log) > 0:
+        error_filename = f"data/collection_errors_{timestamp}.csv"
+        pd.DataFrame(error_log).to_csv(error_filename, index=False)
+        log_step('Error Logging', f'Saved {len(error_log)} errors to {error_filename}')
+
+    duration = time.time() - start
+    log_step('Streaming Complete', f"Integrated {rows_written} rows in {duration:.1f}s, "
+             f"{stats['unmatched']} unmatched, {stats['duplicates']} duplicates dropped, {len(error_log)} errors")
+    report_key_usage()
+
+    # Publish the completed stream as the final dataset in one step
+    if rows_written > 0:
+        os.replace(stream_filename, final_filename)
+        log_step('Final Dataset', f'Created final integrated dataset: {final_filename}')
+        # One cube update per run; readings are deduplicated, so re-integrating this run's
+        # raw file with clean_and_integrate later adds nothing twice
+        update_cube(pd.read_csv(final_filename), source_id=f'stream_{timestamp}')
+    return rows_written
+
+def main(batch_size=50):
+    """Main execution function"""
+    print("=== Streaming Collection and Integration Script ===\n")
+
+    top_cities, city_lookup = load_city_lookup()
+    run_streaming_pipeline(top_cities, city_lookup, batch_size=batch_size)
+    export_curation_log()
+
+    print("\n=== Streaming Pipeline Complete ===")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Synthetic Data Generator
+Builds seeded worldcities-like and raw-AQI-like tables of any size, with
+duplicates and missing values, for benchmarking the post-collection pipeline
+"""
+
+import pandas as pd
+import numpy as np
+import os
+from datetime import datetime, timedelta
+
+AQI_CATEGORIES = [
+    (80, 'Excellent air quality'),
+    (60, 'Good air quality'),
+    (40, 'Moderate air quality'),
+    (20, 'Low air quality'),
+    (0, 'Poor air quality')
+]
+POLLUTANTS = ['pm25', 'pm10', 'o3', 'no2', 'so2', 'co']
+POLLUTANT_WEIGHTS = [0.45, 0.2, 0.15, 0.12, 0.05, 0.03]
+
+def make_countries(num_countries, rng):
+    """Synthetic country names with matching ISO2/ISO3 codes"""
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    codes = set()
+    while len(codes) < num_countries:
+        codes.add(''.join(rng.choice(letters, 3)))
+    codes = sorted(codes)
+    return pd.DataFrame({
+        'country': [f'Country {code}' for code in codes],
+        'iso2': [code[:2] for code in codes],
+        'iso3': codes
+    })
+
+def aqi_to_category(aqi):
+    """Map AQI values to the API's category labels"""
+    categories = np.full(len(aqi), None, dtype=object)
+    for threshold, label in reversed(AQI_CATEGORIES):
+        categories[aqi >= threshold] = label
+    categories[np.isnan(aqi)] = None
+    return categories
+
+def generate_worldcities(num_rows, seed=42, duplicate_rate=0.02, missing_rate=0.05, num_countries=200):
+    """worldcities.csv-like table with duplicate city-country pairs and missing values"""
+    rng = np.random.default_rng(seed)
+    num_unique = int(num_rows * (1 - duplicate_rate))
+    countries = make_countries(num_countries, rng)
+    country_idx = rng.integers(0, num_countries, num_unique)
+
+    cities = pd.DataFrame({
+        'city': [f'City {i}' for i in range(num_unique)],
+        'lat': rng.uniform(-60, 70, num_unique).round(4),
+        'lng': rng.uniform(-180, 180, num_unique).round(4),
+        'country': countries['country'].to_numpy()[country_idx],
+        'iso2': countries['iso2'].to_numpy()[country_idx],
+        'iso3': countries['iso3'].to_numpy()[country_idx],
+        'admin_name': [f'Region {i}' for i in rng.integers(0, 5000, num_unique)],
+        'capital': rng.choice(['', 'admin', 'minor', 'primary'], num_unique, p=[0.7, 0.1, 0.19, 0.01]),
+        # Heavy-tailed like real city sizes
+        'population': np.round(rng.pareto(1.2, num_unique) * 20000 + 1000)
+    })
+    cities.insert(1, 'city_ascii', cities['city'])
+
+    # Duplicate city-country pairs with slightly different coordinates
+    duplicates = cities.sample(num_rows - num_unique, random_state=seed, replace=True)
+    duplicates['lat'] = (duplicates['lat'] + rng.normal(0, 0.01, len(duplicates))).round(4)
+    cities = pd.concat([cities, duplicates]).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+    cities.loc[rng.random(len(cities)) < missing_rate, 'population'] = np.nan
+    cities.loc[rng.random(len(cities)) < missing_rate / 10, ['lat', 'lng']] = np.nan
+    cities['id'] = np.arange(1000000000, 1000000000 + len(cities))
+    return cities
+
+def generate_raw_air_quality(cities, seed=42, error_rate=0.1, missing_aqi_rate=0.02, start=None):
+    """raw_air_quality_<ts>.csv-like table for the given cities, with failed and incomplete readings"""
+    rng = np.random.default_rng(seed)
+    n = len(cities)
+    start = start or datetime(2025, 12, 7, 14, 0, 0)
+
+    aqi = np.clip(rng.normal(62, 15, n), 0, 100).round()
+    failed = rng.random(n) < error_rate
+    aqi[failed | (rng.random(n) < missing_aqi_rate)] = np.nan
+
+    pollutants = rng.choice(POLLUTANTS, n, p=POLLUTANT_WEIGHTS).astype(object)
+    pollutants[np.isnan(aqi)] = None
+    offsets = np.sort(rng.uniform(0, max(n * 0.8, 1), n))
+    timestamps = [(start + timedelta(seconds=float(s))).isoformat() for s in offsets]
+
+    return pd.DataFrame({
+        'city': cities['city'].to_numpy(),
+        'country': cities['country'].to_numpy(),
+        'lat': cities['lat'].to_numpy(),
+        'lon': cities['lng'].to_numpy(),
+        'aqi': aqi,
+        'aqi_category': aqi_to_category(aqi),
+        'dominant_pollutant': pollutants,
+        'collection_timestamp': timestamps,
+        'status': np.where(failed, 'error', 'success')
+    })
+
+def generate_pipeline_inputs(num_rows, seed=42):
+    """Cities and matching raw AQI tables as load_data_for_cleaning would return them"""
+    cities = generate_worldcities(num_rows, seed=seed)
+    raw_aq = generate_raw_air_quality(cities, seed=seed + 1)
+
+    # Like select_top_500_cities, only cities with population and coordinates are kept
+    # (duplicates survive, as they do in the real selection)
+    selected = cities[
+        cities['population'].notna() &
+        cities['lat'].notna() &
+        cities['lng'].notna()
+    ].reset_index(drop=True)
+    return selected, raw_aq
+
+def main(num_rows=1000, seed=42, output_dir='data/synthetic'):
+    """Main execution function"""
+    os.makedirs(output_dir, exist_ok=True)
+    cities = generate_worldcities(num_rows, seed=seed)
+    raw_aq = generate_raw_air_quality(cities, seed=seed + 1)
+    cities.to_csv(f'{output_dir}/worldcities_{num_rows}.csv', index=False)
+    raw_aq.to_csv(f'{output_dir}/raw_air_quality_{num_rows}.csv', index=False)
+    print(f"Saved {num_rows} synthetic cities and AQI records to {output_dir}/")
+
+if __name__ == "__main__":
+    main()